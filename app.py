@@ -2,13 +2,17 @@
 # Run: streamlit run app.py
 
 import html
+import os
+import uuid
 from datetime import datetime
+from typing import Optional
 
-import pandas as pd
-import matplotlib.pyplot as plt
 import streamlit as st
 
+import dataset
+import history_store
 import llm
+import metrics
 
 TITLE_TEXT = "Writing a Complete Scientific Argument"
 st.set_page_config(page_title=TITLE_TEXT, layout="wide")
@@ -48,6 +52,7 @@ st.markdown(f"""
 }}
 .fb--ok  {{ background:#E8FAF0; border-color:#B7E2C2; color:#14532D; border-left:6px solid #16A34A; }}
 .fb--warn{{ background:#FEF3C7; border-color:#FDE68A; color:#7C2D12; border-left:6px solid #F59E0B; }}
+.fb--pending{{ background:#F3F4F6; border-color:#E5E7EB; color:#374151; border-left:6px solid #9CA3AF; }}
 
 .fb__icon{{
   font-size:28px; line-height:1; min-width:28px;
@@ -75,80 +80,135 @@ def _esc_html(s: str) -> str:
     if not s: return ""
     return html.escape(s).replace("\n", "<br>")
 
-def show_feedback_bar(text: str, passed: bool = True, who: str = "Tutor feedback"):
-    """Render a callout feedback bar with robot icon and left color rail."""
+def show_feedback_bar(text: str, passed: Optional[bool] = True, who: str = "Tutor feedback", target=None):
+    """Render a callout feedback bar with robot icon and left color rail.
+
+    passed=None renders a neutral bar (label not known yet, while streaming);
+    `target` is an st.empty() placeholder to draw into instead of the page.
+    """
     icon_html = "🤖"
-    klass = "fb--ok" if passed else "fb--warn"
+    klass = "fb--pending" if passed is None else ("fb--ok" if passed else "fb--warn")
     html_box = f"""
     <div class="fb {klass}">
       <div class="fb__icon">{icon_html}</div>
       <div class="fb__text"><strong>{who}:</strong> {_esc_html(text)}</div>
     </div>
     """
-    st.markdown(html_box, unsafe_allow_html=True)
+    (target or st).markdown(html_box, unsafe_allow_html=True)
+
+def _evidence_card(r, n, claim_label):
+    badge = "badge-pass" if r["passed"] else "badge-fail"
+    status = "Passed" if r["passed"] else "Needs work"
+    conf_txt = f'{r.get("confidence",0):.2f}' if isinstance(r.get("confidence"), (int,float)) else ""
+    label_txt = r.get("label","")
+    return (
+        f'<div class="hist-card">'
+        f'  <div class="hist-title">'
+        f'    <div><strong>Attempt #{n}</strong> • <span class="smallnote">{r["ts"]}</span></div>'
+        f'    <div><span class="{badge}">{status}</span> <span class="badge-claim">{claim_label}</span></div>'
+        f'  </div>'
+        f'  <div class="smallnote">Label: {label_txt}{(" • Conf: "+conf_txt) if conf_txt else ""}</div>'
+        f'  <div class="hist-body">'
+        f'    <div class="section-label">Your claim</div>'
+        f'    <blockquote>{_esc_html(claim_label)}</blockquote>'
+        f'    <div class="section-label">Your evidence</div>'
+        f'    <blockquote>{_esc_html(r["text"]) if r["text"] else "<i>(empty)</i>"}</blockquote>'
+        f'    <div class="section-label">Feedback</div>'
+        f'    <blockquote>{_esc_html(r["feedback"])}</blockquote>'
+        f'  </div>'
+        f'</div>'
+    )
 
-def _render_evidence_history(records, claim_label):
-    if not records:
-        st.caption("No attempts yet for this claim. Submit to see history here.")
-        return
-    html_cards = ['<div class="history-wrap"><div class="history-scroll">']
-    for idx, r in enumerate(reversed(records), start=1):
-        badge = "badge-pass" if r["passed"] else "badge-fail"
-        status = "Passed" if r["passed"] else "Needs work"
-        conf_txt = f'{r.get("confidence",0):.2f}' if isinstance(r.get("confidence"), (int,float)) else ""
-        label_txt = r.get("label","")
-        html_cards.append(
-            f'<div class="hist-card">'
-            f'  <div class="hist-title">'
-            f'    <div><strong>Attempt #{len(records)-idx+1}</strong> • <span class="smallnote">{r["ts"]}</span></div>'
-            f'    <div><span class="{badge}">{status}</span> <span class="badge-claim">{claim_label}</span></div>'
-            f'  </div>'
-            f'  <div class="smallnote">Label: {label_txt}{(" • Conf: "+conf_txt) if conf_txt else ""}</div>'
-            f'  <div class="hist-body">'
-            f'    <div class="section-label">Your claim</div>'
-            f'    <blockquote>{_esc_html(claim_label)}</blockquote>'
-            f'    <div class="section-label">Your evidence</div>'
-            f'    <blockquote>{_esc_html(r["text"]) if r["text"] else "<i>(empty)</i>"}</blockquote>'
-            f'    <div class="section-label">Feedback</div>'
-            f'    <blockquote>{_esc_html(r["feedback"])}</blockquote>'
-            f'  </div>'
-            f'</div>'
-        )
-    html_cards.append('</div></div>')
-    st.markdown("".join(html_cards), unsafe_allow_html=True)
-
-def _render_reasoning_history(records, claim_label):
-    if not records:
+def _reasoning_card(r, n, claim_label):
+    badge = "badge-pass" if r["passed"] else "badge-fail"
+    status = "Passed" if r["passed"] else "Needs work"
+    conf_txt = f'{r.get("confidence",0):.2f}' if isinstance(r.get("confidence"), (int,float)) else ""
+    label_txt = r.get("label","")
+    ev_snap = r.get("evidence", "")
+    return (
+        f'<div class="hist-card">'
+        f'  <div class="hist-title">'
+        f'    <div><strong>Attempt #{n}</strong> • <span class="smallnote">{r["ts"]}</span></div>'
+        f'    <div><span class="{badge}">{status}</span> <span class="badge-claim">{claim_label}</span></div>'
+        f'  </div>'
+        f'  <div class="smallnote">Label: {label_txt}{(" • Conf: "+conf_txt) if conf_txt else ""}</div>'
+        f'  <div class="hist-body">'
+        f'    <div class="section-label">Your claim</div>'
+        f'    <blockquote>{_esc_html(claim_label)}</blockquote>'
+        f'    <div class="section-label">Your evidence (snapshot)</div>'
+        f'    <blockquote>{_esc_html(ev_snap) if ev_snap else "<i>(empty)</i>"}</blockquote>'
+        f'    <div class="section-label">Your reasoning</div>'
+        f'    <blockquote>{_esc_html(r["text"]) if r["text"] else "<i>(empty)</i>"}</blockquote>'
+        f'    <div class="section-label">Feedback</div>'
+        f'    <blockquote>{_esc_html(r["feedback"])}</blockquote>'
+        f'  </div>'
+        f'</div>'
+    )
+
+_CARD_RENDERERS = {"evidence": _evidence_card, "reasoning": _reasoning_card}
+HISTORY_PAGE_SIZE = 5
+
+def _card(kind, record, n):
+    return _CARD_RENDERERS[kind](record, n, (record.get("claim") or "").capitalize())
+
+def _index_attempt(kind, record):
+    """Count a new record under its claim and keep its card in the newest page (cards never change)."""
+    ss = st.session_state
+    claim = record.get("claim") or ""
+    counts = ss[f"{kind}_counts"]
+    counts[claim] = counts.get(claim, 0) + 1
+    cards = ss[f"{kind}_cards"].setdefault(claim, [])
+    cards.append(_card(kind, record, counts[claim]))
+    del cards[:-HISTORY_PAGE_SIZE]
+
+def _show_more(key, shown):
+    st.session_state[key] = shown + HISTORY_PAGE_SIZE
+
+def _render_history(kind, claim):
+    """Newest-first cards for one claim. Session state holds only the newest page;
+    older pages opened with "Show older" are read from the history store."""
+    ss = st.session_state
+    cards = ss[f"{kind}_cards"].get(claim, [])
+    if not cards:
         st.caption("No attempts yet for this claim. Submit to see history here.")
         return
-    html_cards = ['<div class="history-wrap"><div class="history-scroll">']
-    for idx, r in enumerate(reversed(records), start=1):
-        badge = "badge-pass" if r["passed"] else "badge-fail"
-        status = "Passed" if r["passed"] else "Needs work"
-        conf_txt = f'{r.get("confidence",0):.2f}' if isinstance(r.get("confidence"), (int,float)) else ""
-        label_txt = r.get("label","")
-        ev_snap = r.get("evidence", "")
-        html_cards.append(
-            f'<div class="hist-card">'
-            f'  <div class="hist-title">'
-            f'    <div><strong>Attempt #{len(records)-idx+1}</strong> • <span class="smallnote">{r["ts"]}</span></div>'
-            f'    <div><span class="{badge}">{status}</span> <span class="badge-claim">{claim_label}</span></div>'
-            f'  </div>'
-            f'  <div class="smallnote">Label: {label_txt}{(" • Conf: "+conf_txt) if conf_txt else ""}</div>'
-            f'  <div class="hist-body">'
-            f'    <div class="section-label">Your claim</div>'
-            f'    <blockquote>{_esc_html(claim_label)}</blockquote>'
-            f'    <div class="section-label">Your evidence (snapshot)</div>'
-            f'    <blockquote>{_esc_html(ev_snap) if ev_snap else "<i>(empty)</i>"}</blockquote>'
-            f'    <div class="section-label">Your reasoning</div>'
-            f'    <blockquote>{_esc_html(r["text"]) if r["text"] else "<i>(empty)</i>"}</blockquote>'
-            f'    <div class="section-label">Feedback</div>'
-            f'    <blockquote>{_esc_html(r["feedback"])}</blockquote>'
-            f'  </div>'
-            f'</div>'
-        )
-    html_cards.append('</div></div>')
-    st.markdown("".join(html_cards), unsafe_allow_html=True)
+    total = ss[f"{kind}_counts"].get(claim, 0)
+    shown_key = f"{kind}_shown_{claim}"
+    shown = ss.get(shown_key, HISTORY_PAGE_SIZE)
+    if shown > len(cards) and total > len(cards):
+        start, recs = get_history_store().page(session_id(), kind, claim, before=total - len(cards),
+                                               limit=shown - len(cards))
+        cards = [_card(kind, r, start + i + 1) for i, r in enumerate(recs)] + cards
+    st.markdown('<div class="history-wrap"><div class="history-scroll">'
+                + "".join(reversed(cards)) + '</div></div>', unsafe_allow_html=True)
+    older = total - len(cards)
+    if older > 0:
+        st.button(f"Show {min(older, HISTORY_PAGE_SIZE)} older attempt(s)", key=f"{kind}_more_{claim}",
+                  on_click=_show_more, args=(shown_key, shown))
+
+def _hidden_other_claims(kind, claim):
+    return sum(n for k, n in st.session_state[f"{kind}_counts"].items() if k != claim)
+
+# ---------- History storage ----------
+@st.cache_resource(show_spinner=False)
+def get_history_store():
+    """Process-wide store for attempt records; on llm.SHARED_STORE when replicas share state."""
+    return history_store.open_history(llm.SHARED_STORE, os.environ.get("HISTORY_DB_PATH", ".cache/history.sqlite"))
+
+def session_id() -> str:
+    """Stable id kept in the URL (?sid=...) so a reload or restart finds the same history."""
+    ss = st.session_state
+    if "session_id" not in ss:
+        sid = st.query_params.get("sid")
+        if not sid:
+            sid = uuid.uuid4().hex
+            st.query_params["sid"] = sid
+        ss.session_id = sid
+    return ss.session_id
+
+def record_attempt(kind: str, record: dict):
+    _index_attempt(kind, record)
+    get_history_store().append(session_id(), kind, record)
 
 # ---------- State ----------
 def init_state():
@@ -166,9 +226,20 @@ def init_state():
     ss.setdefault("reasoning_fb", "")
 
     ss.setdefault("submitted", False)
-
-    ss.setdefault("evidence_history", [])
-    ss.setdefault("reasoning_history", [])
+    # prompt version stays fixed for the session: ?prompt=<version> pins it, else PROMPT_SPLIT decides
+    if "prompt_version" not in ss:
+        ss.prompt_version = llm.session_prompt_version(session_id(), st.query_params.get("prompt"))
+
+    # per-claim attempt counts + the newest page of pre-rendered cards, read from the store once per session
+    if "evidence_counts" not in ss or "reasoning_counts" not in ss:
+        store, sid = get_history_store(), session_id()
+        counts = store.counts(sid)
+        for kind in ("evidence", "reasoning"):
+            ss[f"{kind}_counts"] = counts[kind]
+            ss[f"{kind}_cards"] = {}
+            for claim in counts[kind]:
+                start, recs = store.page(sid, kind, claim, limit=HISTORY_PAGE_SIZE)
+                ss[f"{kind}_cards"][claim] = [_card(kind, r, start + i + 1) for i, r in enumerate(recs)]
 init_state()
 
 def reset_after_claim_change(keep_text=True):
@@ -194,39 +265,43 @@ def unlock_reasoning():
     st.session_state.submitted = False
 
 # ---------- Data & Figure ----------
+# pandas/matplotlib stay out of the cold-start path: the table is a plain dict and
+# the chart is a PNG rendered once to disk (see dataset.py).
 @st.cache_data(show_spinner=False)
 def load_dataset():
-    return pd.DataFrame({
-        "Year": [1, 2, 3, 4, 5],
-        "# of Corn Planted": [130, 130, 130, 130, 130],
-        "# of Corn Harvested": [130, 97, 91, 84, 80],
-        "Harvest Spiders": [0, 0, 10, 10, 10],
-        "Rootworms Eggs Initial": [0, 18, 29, 41, 41],
-        "Rootworms Eggs Final": [0, 53, 89, 89, 100],
-    })
+    return dataset.TABLE
 
 @st.cache_resource(show_spinner=False)
-def build_figure(df: pd.DataFrame):
-    palette = ["#4C78A8", "#72B7B2", "#A0A0A0", "#F2CF5B", "#E15759"]
-    fig, ax = plt.subplots(figsize=(8.8, 4.6), dpi=120)
-    x = df["Year"]
-    ax.plot(x, df["# of Corn Planted"], marker="o", label="# of Corn Planted", color=palette[0])
-    ax.plot(x, df["# of Corn Harvested"], marker="o", label="# of Corn Harvested", color=palette[1])
-    ax.plot(x, df["Harvest Spiders"], marker="o", label="# Harvest Spiders", color=palette[2])
-    ax.plot(x, df["Rootworms Eggs Initial"], marker="o", label="# Rootworm Eggs Initial", color=palette[3])
-    ax.plot(x, df["Rootworms Eggs Final"], marker="o", label="# Rootworm Eggs Final", color=palette[4])
-    ax.set_xlabel("Year"); ax.set_ylabel("Count"); ax.set_xlim(1,5); ax.grid(alpha=.18)
-    ax.legend(loc="upper center", bbox_to_anchor=(0.5, -0.22), ncol=3, frameon=False)
-    plt.tight_layout()
-    return fig
+def build_figure():
+    return dataset.figure_png()
 
 df = load_dataset()
-fig = build_figure(df)
+fig = build_figure()
 
 # ---------- GPT helpers ----------
+_PASS_LABELS = {"supportive", "valid"}
+
+def _stream_feedback(component: str, claim: str, text: str, evidence_text: str = ""):
+    """Show step_feedback as it streams in; returns the final (validated) result."""
+    placeholder = st.empty()
+    out = {}
+    for part in llm.stream_step_feedback(component, claim, text, evidence_text=evidence_text,
+                                         prompt_version=st.session_state.prompt_version):
+        if part["done"]:
+            out = part
+            break
+        label = part.get("label")
+        passed = None if label is None else (label in _PASS_LABELS)
+        show_feedback_bar(part["step_feedback"] or "…", passed, target=placeholder)
+    return out
+
 def gpt_eval_evidence(claim: str, text: str):
-    with st.spinner("Scoring evidence…"):
-        out = llm.step_feedback("evidence", claim, text)
+    with st.spinner("Scoring evidence…"), metrics.REGISTRY.timer("app_eval_seconds", component="evidence"):
+        if llm.STREAM_FEEDBACK:
+            out = _stream_feedback("evidence", claim, text)
+        else:
+            out = llm.run_sync(llm.astep_feedback("evidence", claim, text,
+                                                  prompt_version=st.session_state.prompt_version))
     label = (out.get("label") or "").lower()
     if label not in llm.EVIDENCE_LABELS:
         raise RuntimeError(f"Unexpected evidence label: {label}")
@@ -237,11 +312,10 @@ def gpt_eval_evidence(claim: str, text: str):
         conf = float(out.get("confidence", 0) or 0)
     except Exception:
         pass
-    return {"passed": passed, "feedback": fb, "label": label, "confidence": conf}
+    return {"passed": passed, "feedback": fb, "label": label, "confidence": conf,
+            "prompt_version": out.get("prompt_version")}
 
-def gpt_eval_reasoning(claim: str, text: str):
-    with st.spinner("Scoring reasoning…"):
-        out = llm.step_feedback("reasoning", claim, text, evidence_text=st.session_state.evidence_text)
+def _reasoning_result(out: dict):
     label = (out.get("label") or "").lower()
     if label not in llm.REASONING_LABELS:
         raise RuntimeError(f"Unexpected reasoning label: {label}")
@@ -252,7 +326,48 @@ def gpt_eval_reasoning(claim: str, text: str):
         conf = float(out.get("confidence", 0) or 0)
     except Exception:
         pass
-    return {"passed": passed, "feedback": fb, "label": label, "confidence": conf}
+    return {"passed": passed, "feedback": fb, "label": label, "confidence": conf,
+            "prompt_version": out.get("prompt_version")}
+
+def gpt_eval_reasoning(claim: str, text: str):
+    with st.spinner("Scoring reasoning…"), metrics.REGISTRY.timer("app_eval_seconds", component="reasoning"):
+        if llm.STREAM_FEEDBACK:
+            out = _stream_feedback("reasoning", claim, text, evidence_text=st.session_state.evidence_text)
+        else:
+            out = llm.run_sync(llm.astep_feedback("reasoning", claim, text, evidence_text=st.session_state.evidence_text,
+                                                  prompt_version=st.session_state.prompt_version))
+    return _reasoning_result(out)
+
+def apply_reasoning_result(result: dict):
+    st.session_state.reasoning_ok = result["passed"]
+    st.session_state.reasoning_fb = result["feedback"]
+    st.session_state.submitted = False
+    record_attempt("reasoning", {
+        "claim": st.session_state.claim,
+        "text": st.session_state.reasoning_text.strip(),
+        "label": result["label"],
+        "confidence": result["confidence"],
+        "feedback": result["feedback"],
+        "passed": result["passed"],
+        "evidence": st.session_state.evidence_text.strip(),  # evidence snapshot
+        "prompt_version": result["prompt_version"],
+        "ts": datetime.now().isoformat(timespec="seconds"),
+    })
+
+def speculator() -> "llm.ReasoningSpeculator":
+    if "speculator" not in st.session_state:
+        st.session_state.speculator = llm.ReasoningSpeculator()
+    return st.session_state.speculator
+
+def take_speculation(timeout) -> bool:
+    """Apply the background reasoning grade if it matches the current texts and is done
+    within `timeout` (None = wait); otherwise it stays pending. True if applied."""
+    spec = speculator().take(st.session_state.claim, st.session_state.evidence_text,
+                             st.session_state.reasoning_text, timeout=timeout)
+    if spec is None or spec.get("label") not in llm.REASONING_LABELS:
+        return False
+    apply_reasoning_result(_reasoning_result(spec))
+    return True
 
 # ---------- Layout ----------
 left, right = st.columns([1.2, 1.8], gap="large")
@@ -268,7 +383,7 @@ Analyze the data trend and make your own prediction about the Year 6 corn harves
     st.markdown("**Yearly data:**")
     st.dataframe(df, use_container_width=True, hide_index=True)
     st.markdown("**Impact of Harvest Spiders on Corn Harvest and Rootworm Population:**")
-    st.pyplot(fig, use_container_width=True)
+    st.image(fig, use_container_width=True)
 
 with right:
     st.header("Student Workspace")
@@ -318,20 +433,31 @@ with right:
 
     if ev_btn:
         try:
+            # reasoning already drafted: grade it against this evidence snapshot in parallel
+            if llm.SPECULATIVE_REASONING and st.session_state.reasoning_text.strip():
+                speculator().start(st.session_state.claim, st.session_state.evidence_text,
+                                   st.session_state.reasoning_text, prompt_version=st.session_state.prompt_version)
             result = gpt_eval_evidence(st.session_state.claim, st.session_state.evidence_text)
             st.session_state.evidence_ok = result["passed"]
             st.session_state.evidence_fb = result["feedback"]
             st.session_state.submitted = False
-            st.session_state.evidence_history.append({
+            record_attempt("evidence", {
                 "claim": st.session_state.claim,
                 "text": st.session_state.evidence_text.strip(),
                 "label": result["label"],
                 "confidence": result["confidence"],
                 "feedback": result["feedback"],
                 "passed": result["passed"],
+                "prompt_version": result["prompt_version"],
                 "ts": datetime.now().isoformat(timespec="seconds"),
             })
+            if not result["passed"]:
+                speculator().discard()
+            else:
+                take_speculation(llm.SPECULATIVE_TAKE_WAIT)
             st.rerun()
+        except llm.CircuitOpenError as e:
+            st.warning(f"The feedback service is busy right now. Please try again in about {max(5, round(e.retry_in))} seconds.")
         except Exception as e:
             st.error(f"Error while checking evidence: {e}")
 
@@ -339,12 +465,11 @@ with right:
         show_feedback_bar(st.session_state.evidence_fb, st.session_state.evidence_ok)
 
     curr_claim = st.session_state.claim
-    ev_records = [r for r in st.session_state.evidence_history if r.get("claim") == curr_claim]
     st.markdown("**Your Evidence Attempts & Feedback**")
-    other_ev = len(st.session_state.evidence_history) - len(ev_records)
+    other_ev = _hidden_other_claims("evidence", curr_claim)
     if other_ev > 0:
         st.caption(f"{other_ev} attempt(s) from the other claim are hidden.")
-    _render_evidence_history(ev_records, curr_claim.capitalize())
+    _render_history("evidence", curr_claim)
 
     if not st.session_state.evidence_ok:
         st.info("Refine your Evidence until it passes to unlock Reasoning.")
@@ -352,6 +477,8 @@ with right:
 
     # Step 3 — Reasoning
     st.divider(); st.subheader("3) Reasoning")
+    if not st.session_state.reasoning_ok:
+        take_speculation(0)  # finished since the evidence click
     st.markdown('<div class="inst">Describe how your evidence supports your claim. Use what you know about predators, prey, and ecosystem balance to explain how your data supports your claim.</div>',
                 unsafe_allow_html=True)
     st.text_area(
@@ -370,21 +497,13 @@ with right:
 
     if rs_btn:
         try:
-            result = gpt_eval_reasoning(st.session_state.claim, st.session_state.reasoning_text)
-            st.session_state.reasoning_ok = result["passed"]
-            st.session_state.reasoning_fb = result["feedback"]
-            st.session_state.submitted = False
-            st.session_state.reasoning_history.append({
-                "claim": st.session_state.claim,
-                "text": st.session_state.reasoning_text.strip(),
-                "label": result["label"],
-                "confidence": result["confidence"],
-                "feedback": result["feedback"],
-                "passed": result["passed"],
-                "evidence": st.session_state.evidence_text.strip(),  # evidence snapshot
-                "ts": datetime.now().isoformat(timespec="seconds"),
-            })
+            with st.spinner("Scoring reasoning…"):
+                taken = take_speculation(None)  # still grading this exact text in the background
+            if not taken:
+                apply_reasoning_result(gpt_eval_reasoning(st.session_state.claim, st.session_state.reasoning_text))
             st.rerun()
+        except llm.CircuitOpenError as e:
+            st.warning(f"The feedback service is busy right now. Please try again in about {max(5, round(e.retry_in))} seconds.")
         except Exception as e:
             st.error(f"Error while checking reasoning: {e}")
 
@@ -392,11 +511,10 @@ with right:
         show_feedback_bar(st.session_state.reasoning_fb, st.session_state.reasoning_ok)
 
     st.markdown("**Your Reasoning Attempts & Feedback**")
-    rs_records = [r for r in st.session_state.reasoning_history if r.get("claim") == curr_claim]
-    other_rs = len(st.session_state.reasoning_history) - len(rs_records)
+    other_rs = _hidden_other_claims("reasoning", curr_claim)
     if other_rs > 0:
         st.caption(f"{other_rs} attempt(s) from the other claim are hidden.")
-    _render_reasoning_history(rs_records, curr_claim.capitalize())
+    _render_history("reasoning", curr_claim)
 
     # Final submit
     if st.session_state.evidence_ok and st.session_state.reasoning_ok:
@@ -0,0 +1,69 @@
+# bench/batch.py
+# Offline regrade cost: one step_feedback call per submission vs step_feedback_batch,
+# both against mock_azure. Reports requests, prompt tokens (from the usage blocks)
+# and wall time for the same set of unique evidence + reasoning submissions.
+# Run: python bench/batch.py [--students 60] [--batch 10]
+from __future__ import annotations
+import argparse, json, os, sys, time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+import mock_azure  # noqa: E402
+
+
+def submissions(n):
+    for sid in range(n):
+        claim = "agree" if sid % 2 else "disagree"
+        ev = f"Student {sid}: corn harvested fell from 130 to 80 while rootworm eggs rose from 0 to 100."
+        rs = f"Student {sid}: spiders eat rootworms, but 10 spiders are too few for 41 eggs, so the harvest drops."
+        yield claim, ev, rs
+
+
+def per_item(llm, rows):
+    for claim, ev, rs in rows:
+        llm.step_feedback("evidence", claim, ev)
+        llm.step_feedback("reasoning", claim, rs, evidence_text=ev)
+
+
+def batched(llm, rows):
+    for claim in ("agree", "disagree"):
+        mine = [r for r in rows if r[0] == claim]
+        llm.step_feedback_batch("evidence", claim, [r[1] for r in mine])
+        llm.step_feedback_batch("reasoning", claim, [r[2] for r in mine], evidence_texts=[r[1] for r in mine])
+
+
+def measure(llm, fn, rows):
+    before = llm.usage_stats()
+    t0 = time.perf_counter()
+    fn(llm, rows)
+    after = llm.usage_stats()
+    return {"requests": after["calls"] - before["calls"],
+            "prompt_tokens": after["prompt_tokens"] - before["prompt_tokens"],
+            "completion_tokens": after["completion_tokens"] - before["completion_tokens"],
+            "seconds": round(time.perf_counter() - t0, 2)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--students", type=int, default=60)
+    ap.add_argument("--batch", type=int, default=10, help="LLM_BATCH_MAX_ITEMS")
+    ap.add_argument("--latency", default="const:0.05")
+    args = ap.parse_args()
+
+    mock = mock_azure.MockAzure(latency=args.latency).start()
+    os.environ.update(AZURE_ENDPOINT=mock.url, AZURE_API_KEY="bench", AZURE_DEPLOYMENT="mock",
+                      AZURE_API_VERSION="2024-06-01", LLM_CACHE_ENABLED="0", PRESCREEN_ENABLED="0",
+                      LLM_BATCH_MAX_ITEMS=str(args.batch))
+    import llm
+
+    rows = list(submissions(args.students))
+    report = {"per_item": measure(llm, per_item, rows), "batched": measure(llm, batched, rows),
+              "batch_stats": llm.batch_stats()}
+    a, b = report["per_item"], report["batched"]
+    report["prompt_tokens_saved"] = 1 - b["prompt_tokens"] / a["prompt_tokens"] if a["prompt_tokens"] else None
+    print(json.dumps(report, indent=2))
+    mock.stop()
+
+
+if __name__ == "__main__":
+    main()
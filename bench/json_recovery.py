@@ -0,0 +1,83 @@
+# bench/json_recovery.py
+# Recovery rate and parse cost on recorded raw model outputs (bench/json_corpus.jsonl):
+# legacy fence-strip + greedy regex + json.loads vs llm_json.parse.
+# A line counts as recovered when the parsed label equals "expect"; lines with
+# expect=null must be rejected (those go to the re-ask).
+# Run: python bench/json_recovery.py [-n 2000] [-v]
+from __future__ import annotations
+import argparse, json, os, re, sys, timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+import llm_json  # noqa: E402
+
+LABELS = {"evidence": {"supportive", "non_supportive"}, "reasoning": {"valid", "alternative"}}
+
+
+# ---- legacy path (llm._json_only + _parse_component + the label check) ----
+def _legacy_strip_code_fences(s):
+    return re.sub(r"^```(?:json)?\s*|\s*```$", "", s.strip(), flags=re.I | re.M)
+
+def _legacy_json_only(s):
+    s = _legacy_strip_code_fences(s)
+    m = re.search(r"\{.*\}", s, flags=re.S)
+    if m:
+        s = m.group(0)
+    return json.loads(s)
+
+def legacy(raw, labels):
+    obj = _legacy_json_only(raw)
+    label = str(obj.get("label", "")).strip().lower()
+    if label not in labels:
+        raise ValueError(label)
+    return label
+
+
+def current(raw, labels):
+    return llm_json.parse(raw, labels)[0]["label"]
+
+
+def score(fn, rows, verbose=False):
+    ok = 0
+    for r in rows:
+        try:
+            got = fn(r["raw"], LABELS[r["component"]])
+        except ValueError:
+            got = None
+        ok += got == r["expect"]
+        if verbose and got != r["expect"]:
+            print(f"  {fn.__name__}: expected {r['expect']!r}, got {got!r}: {r['raw'][:70]!r}")
+    return ok
+
+
+def per_parse_us(fn, rows, n):
+    def run():
+        for r in rows:
+            try:
+                fn(r["raw"], LABELS[r["component"]])
+            except ValueError:
+                pass
+    return min(timeit.repeat(run, number=n, repeat=3)) / (n * len(rows)) * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=2000)
+    ap.add_argument("-v", action="store_true", help="list misses")
+    args = ap.parse_args()
+
+    with open(os.path.join(HERE, "json_corpus.jsonl"), encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    valid = [r for r in rows if r["raw"].strip().startswith("{") and r["expect"]
+             and llm_json.extract(r["raw"])[1] == ()]
+
+    print(f"{len(rows)} recorded outputs ({sum(r['expect'] is None for r in rows)} should be rejected)")
+    for fn in (legacy, current):
+        hit = score(fn, rows, args.v)
+        print(f"{fn.__name__:8s} correct {hit:3d}/{len(rows)} ({hit / len(rows):5.1%})   "
+              f"{per_parse_us(fn, rows, args.n):6.1f} us/parse all   "
+              f"{per_parse_us(fn, valid, args.n):6.1f} us/parse already-valid")
+
+
+if __name__ == "__main__":
+    main()
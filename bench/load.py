@@ -0,0 +1,200 @@
+# bench/load.py
+# Load/latency benchmark for the grading path against mock_azure (no Azure spend).
+#
+# Drives N simulated students through evidence -> reasoning (re-submitting until
+# each step passes, up to --attempts) and writes a machine-readable report.
+#
+# Run: python bench/load.py --students 60 --latency lognormal:0.8,0.35 --out bench_results.json
+from __future__ import annotations
+import argparse, asyncio, json, os, platform, random, resource, subprocess, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+import mock_azure  # noqa: E402
+
+
+def pct(xs, p):
+    if not xs:
+        return None
+    xs = sorted(xs)
+    k = (len(xs) - 1) * p / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+
+def summarize(xs):
+    return {"n": len(xs), "p50": pct(xs, 50), "p95": pct(xs, 95), "p99": pct(xs, 99),
+            "mean": (sum(xs) / len(xs)) if xs else None, "max": max(xs) if xs else None}
+
+
+def git_rev():
+    try:
+        return subprocess.check_output(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {"evidence": [], "reasoning": []}
+        self.errors = []
+        self.students_done = 0
+
+    def add(self, component, seconds):
+        with self.lock:
+            self.latency[component].append(seconds)
+
+    def error(self, e):
+        with self.lock:
+            self.errors.append(f"{type(e).__name__}: {e}"[:200])
+
+
+def _texts(sid, attempt):
+    # unique per student/attempt so the response cache and coalescing don't hide upstream cost
+    ev = f"Student {sid} attempt {attempt}: corn harvested fell from 130 to 80 while rootworm eggs rose to 100."
+    rs = f"Student {sid} attempt {attempt}: spiders eat rootworms but 10 spiders are too few for 41 eggs."
+    return ev, rs
+
+
+async def student_async(llm, sid, args, rec):
+    claim = random.choice(["agree", "disagree"])
+    await asyncio.sleep(random.uniform(0, args.ramp))
+    evidence = ""
+    for component in ("evidence", "reasoning"):
+        for attempt in range(args.attempts):
+            ev, rs = _texts(sid, attempt)
+            evidence = ev if component == "evidence" else evidence
+            t0 = time.perf_counter()
+            try:
+                out = await llm.astep_feedback(component, claim, ev if component == "evidence" else rs,
+                                               evidence_text=evidence)
+            except Exception as e:
+                rec.error(e)
+                return
+            rec.add(component, time.perf_counter() - t0)
+            if out["label"] in ("supportive", "valid"):
+                break
+            await asyncio.sleep(random.uniform(0, args.think))
+    with rec.lock:
+        rec.students_done += 1
+
+
+def student_sync(llm, sid, args, rec):
+    claim = random.choice(["agree", "disagree"])
+    time.sleep(random.uniform(0, args.ramp))
+    evidence = ""
+    for component in ("evidence", "reasoning"):
+        for attempt in range(args.attempts):
+            ev, rs = _texts(sid, attempt)
+            evidence = ev if component == "evidence" else evidence
+            t0 = time.perf_counter()
+            try:
+                out = llm.step_feedback(component, claim, ev if component == "evidence" else rs,
+                                        evidence_text=evidence)
+            except Exception as e:
+                rec.error(e)
+                return
+            rec.add(component, time.perf_counter() - t0)
+            if out["label"] in ("supportive", "valid"):
+                break
+            time.sleep(random.uniform(0, args.think))
+    with rec.lock:
+        rec.students_done += 1
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Concurrent-student load benchmark for llm.step_feedback.")
+    ap.add_argument("--students", type=int, default=60)
+    ap.add_argument("--mode", choices=["async", "sync"], default="async",
+                    help="async = astep_feedback (what app.py uses); sync = step_feedback on threads")
+    ap.add_argument("--attempts", type=int, default=3, help="max submissions per step")
+    ap.add_argument("--ramp", type=float, default=2.0, help="students start uniformly within this many seconds")
+    ap.add_argument("--think", type=float, default=0.5, help="max pause between re-submissions")
+    ap.add_argument("--latency", default="lognormal:0.8,0.35")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--throttle-rate", type=float, default=0.0)
+    ap.add_argument("--pass-rate", type=float, default=0.6)
+    ap.add_argument("--endpoint", help="use an already running mock/endpoint instead of starting one")
+    ap.add_argument("--cache", action="store_true", help="keep the LLM response cache enabled")
+    ap.add_argument("--rpm", type=float, default=0, help="client AZURE_RPM (0 = off; the mock has no quota)")
+    ap.add_argument("--tpm", type=float, default=0, help="client AZURE_TPM (0 = off)")
+    ap.add_argument("--concurrency", type=int, help="client LLM_MAX_CONCURRENCY (default: llm's)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", default="bench_results.json")
+    args = ap.parse_args(argv)
+    random.seed(args.seed)
+
+    mock = None
+    if not args.endpoint:
+        mock = mock_azure.MockAzure(latency=args.latency, error_rate=args.error_rate,
+                                    throttle_rate=args.throttle_rate, pass_rate=args.pass_rate).start()
+    os.environ.update({
+        "AZURE_ENDPOINT": args.endpoint or mock.url, "AZURE_API_KEY": os.environ.get("AZURE_API_KEY", "mock"),
+        "AZURE_DEPLOYMENT": os.environ.get("AZURE_DEPLOYMENT", "mock"),
+        "AZURE_API_VERSION": os.environ.get("AZURE_API_VERSION", "2024-06-01"),
+        "AZURE_RPM": str(args.rpm), "AZURE_TPM": str(args.tpm),
+    })
+    if args.concurrency:
+        os.environ["LLM_MAX_CONCURRENCY"] = str(args.concurrency)
+    if not args.cache:
+        os.environ["LLM_CACHE_ENABLED"] = "0"
+    import llm  # config is read at import, after the env above
+
+    rec = Recorder()
+    ru0, t0 = resource.getrusage(resource.RUSAGE_SELF), time.perf_counter()
+    if args.mode == "async":
+        async def run_all():
+            await asyncio.gather(*(student_async(llm, i, args, rec) for i in range(args.students)))
+        asyncio.run(run_all())
+    else:
+        with ThreadPoolExecutor(max_workers=args.students) as pool:
+            list(pool.map(lambda i: student_sync(llm, i, args, rec), range(args.students)))
+    wall = time.perf_counter() - t0
+    ru1 = resource.getrusage(resource.RUSAGE_SELF)
+
+    calls = rec.latency["evidence"] + rec.latency["reasoning"]
+    deps = llm.deployment_stats()
+    upstream = sum(d["calls"] for d in deps.values())
+    report = {
+        "version": git_rev(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "students": args.students,
+        "students_completed": rec.students_done,
+        "wall_s": wall,
+        "calls": len(calls),
+        "throughput_calls_per_s": len(calls) / wall if wall else None,
+        "latency_s": {"all": summarize(calls),
+                      "evidence": summarize(rec.latency["evidence"]),
+                      "reasoning": summarize(rec.latency["reasoning"])},
+        "upstream_requests": upstream,
+        "retries": upstream - len(calls) - len(rec.errors),
+        "errors": len(rec.errors),
+        "error_samples": rec.errors[:5],
+        "client": {"cpu_user_s": ru1.ru_utime - ru0.ru_utime, "cpu_sys_s": ru1.ru_stime - ru0.ru_stime,
+                   "max_rss_mb": ru1.ru_maxrss / (1024.0 if sys.platform != "darwin" else 1024.0 ** 2)},
+        "deployments": deps,
+        "pool": llm.pool_stats(),
+        "usage": llm.usage_stats(),
+        "coalesce": llm.coalesce_stats(),
+        "prescreen": llm.prescreen_stats(),
+        "metrics": llm.metrics.REGISTRY.summary(),
+        "server": dict(mock.counts) if mock else None,
+    }
+    if mock:
+        mock.stop()
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+    lat = report["latency_s"]["all"]
+    fmt = lambda v: f"{v:.3f}" if v is not None else "-"
+    print(f"{report['calls']} calls in {wall:.1f}s ({fmt(report['throughput_calls_per_s'])}/s)  "
+          f"p50={fmt(lat['p50'])}s p95={fmt(lat['p95'])}s p99={fmt(lat['p99'])}s  "
+          f"retries={report['retries']} errors={report['errors']}  -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# bench/prompt_assembly.py
+# Per-call prompt assembly cost: legacy _inject_vars passes vs the compiled table.
+# Run: python bench/prompt_assembly.py [-n 20000]
+from __future__ import annotations
+import argparse, os, sys, timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import llm_prompts  # noqa: E402
+
+CASES = [("evidence", "agree"), ("evidence", "disagree"), ("reasoning", "agree"), ("reasoning", "disagree")]
+
+
+# ---- legacy path (what step_feedback did per call before compilation) ----
+def _legacy_inject_once(conf, text):
+    comps = conf.get("components", {})
+    return (text
+            .replace("{{common_desc}}", conf.get("common_desc", ""))
+            .replace("{{feedback_style}}", conf.get("feedback_style", ""))
+            .replace("{{evidence_common}}", comps.get("evidence_common", ""))
+            .replace("{{reasoning_common}}", comps.get("reasoning_common", "")))
+
+def _legacy_inject(conf, text, passes=3):
+    out = text
+    for _ in range(passes):
+        new_out = _legacy_inject_once(conf, out)
+        if new_out == out:
+            break
+        out = new_out
+    return out
+
+def legacy_build(conf, component, claim_side, text, evidence):
+    sys_prompt = _legacy_inject(conf, conf["components"][component][claim_side])
+    tpl = conf.get("user_templates", {}).get(component, "{text}")
+    if component == "reasoning":
+        return sys_prompt, tpl.format(reasoning=text, evidence=evidence, claim_side=claim_side)
+    return sys_prompt, tpl.format(text=text, claim_side=claim_side)
+
+
+def compiled_build(table, component, claim_side, text, evidence):
+    cp = llm_prompts.lookup(table, component, claim_side)
+    if component == "reasoning":
+        return cp.system, cp.user_template.format(reasoning=text, evidence=evidence, claim_side=claim_side)
+    return cp.system, cp.user_template.format(text=text, claim_side=claim_side)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--prompts", default="prompts/v3.0.yml")
+    ap.add_argument("-n", type=int, default=20000)
+    args = ap.parse_args()
+
+    conf, _ = llm_prompts.read_prompts(args.prompts)
+    t0 = timeit.default_timer()
+    table = llm_prompts.compile_prompts(conf)
+    compile_ms = (timeit.default_timer() - t0) * 1e3
+
+    text, evidence = "Year 5 harvested 80 corn, down from 97 in year 2.", "Eggs rose from 18 to 100."
+    for comp, side in CASES:
+        assert legacy_build(conf, comp, side, text, evidence) == compiled_build(table, comp, side, text, evidence), (comp, side)
+
+    def run(fn, arg):
+        def go():
+            for comp, side in CASES:
+                fn(arg, comp, side, text, evidence)
+        return min(timeit.repeat(go, number=args.n // len(CASES), repeat=3)) / args.n * 1e6
+
+    legacy_us = run(legacy_build, conf)
+    compiled_us = run(compiled_build, table)
+    print(f"one-time compile:      {compile_ms:8.3f} ms")
+    print(f"legacy   per call:     {legacy_us:8.2f} us")
+    print(f"compiled per call:     {compiled_us:8.2f} us")
+    print(f"speedup:               {legacy_us / compiled_us:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
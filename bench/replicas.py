@@ -0,0 +1,134 @@
+# bench/replicas.py
+# Several worker processes (stand-ins for app replicas) against one shared store
+# and mock_azure, checking what SHARED_STORE_URL promises under contention:
+#   cache    every submission reaches the upstream ~once across all workers, and
+#            every cached read of a submission returns the same feedback
+#   history  every appended attempt is loaded back exactly once
+#   limiter  all workers together are granted no more than one RPM budget
+# Exits 1 if a check fails.
+# Run: python bench/replicas.py [--workers 4] [--submissions 40] [--url redis://localhost:6379/15]
+from __future__ import annotations
+import argparse, json, os, random, subprocess, sys, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+SESSIONS = 5
+LIMITER_RPM = 60
+
+
+def submissions(n):
+    return [(["agree", "disagree"][i % 2], f"Corn harvested fell from 130 to {80 + i % 17} while rootworm eggs "
+                                           f"rose to {41 + i} by year {1 + i % 5}.") for i in range(n)]
+
+
+def worker(args):
+    import llm, history_store, ratelimit
+
+    subs = submissions(args.submissions)
+    random.Random(args.worker).shuffle(subs)  # each replica sees the class in a different order
+
+    def grade(sub):
+        out = llm.step_feedback("evidence", sub[0], sub[1])
+        return {"text": sub[1], "label": out["label"], "feedback": out["step_feedback"],
+                "cached": bool(out.get("cached"))}
+
+    t0 = time.time()
+    with ThreadPoolExecutor(args.threads) as pool:
+        results = list(pool.map(grade, subs))
+    grade_s = time.time() - t0
+
+    hist = history_store.open_history(llm.SHARED_STORE, os.path.join(args.dir, "history.sqlite"))
+    for j in range(args.history):
+        hist.append(f"bench-{j % SESSIONS}", "evidence", {"worker": args.worker, "j": j, "ts": time.time()})
+    hist.flush()
+    hist.close()
+
+    lim = ratelimit.SharedRateLimiter(llm.SHARED_STORE, "bench:limiter", rpm=LIMITER_RPM)
+    first = time.time()
+    immediate = sum(lim.reserve(0) == 0 for _ in range(args.reserves))
+    print(json.dumps({"worker": args.worker, "results": results, "grade_s": grade_s, "cache": llm.cache_stats(),
+                      "immediate": immediate, "reserve_span": [first, time.time()]}))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--threads", type=int, default=4, help="concurrent grading calls per worker")
+    ap.add_argument("--submissions", type=int, default=40)
+    ap.add_argument("--history", type=int, default=50, help="attempt records appended per worker")
+    ap.add_argument("--reserves", type=int, default=50, help="limiter reservations per worker")
+    ap.add_argument("--url", help="SHARED_STORE_URL (default: a fresh sqlite file)")
+    ap.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    ap.add_argument("--dir", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.worker is not None:
+        return worker(args)
+
+    import mock_azure, shared_store, history_store
+    mock = mock_azure.MockAzure(latency="const:0.05", pass_rate=0.5).start()
+    with tempfile.TemporaryDirectory() as d:
+        url = args.url or f"sqlite:///{os.path.join(d, 'shared.sqlite')}"
+        store = shared_store.open_store(url)
+        store.clear("llm:")
+        store.clear("bench:")
+        env = dict(os.environ, AZURE_ENDPOINT=mock.url, AZURE_API_KEY="bench", AZURE_DEPLOYMENT="mock",
+                   AZURE_API_VERSION="2024-06-01", SHARED_STORE_URL=url, PRESCREEN_ENABLED="0",
+                   LLM_CACHE_PATH="", METRICS_PORT="0", METRICS_JSONL="")
+        cmd = [sys.executable, os.path.abspath(__file__), "--dir", d] + [
+            f"--{k}={getattr(args, k)}" for k in ("threads", "submissions", "history", "reserves")]
+        t0 = time.time()
+        procs = [subprocess.Popen(cmd + ["--worker", str(w)], cwd=ROOT, env=env, stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE, text=True) for w in range(args.workers)]
+        outs = []
+        for p in procs:
+            stdout, stderr = p.communicate()
+            if p.returncode:
+                raise SystemExit(f"worker failed:\n{stderr}")
+            outs.append(json.loads(stdout.strip().splitlines()[-1]))
+        wall = time.time() - t0
+        hist = history_store.open_history(store, os.path.join(d, "history.sqlite"))
+        loaded = [rec for s in range(SESSIONS) for rec in hist.load(f"bench-{s}")["evidence"]]
+        hist.close()
+    mock.stop()
+
+    # cache: all cached reads of a submission must agree; raced = answered upstream by >1 worker
+    by_text = {}
+    for o in outs:
+        for r in o["results"]:
+            by_text.setdefault(r["text"], []).append(r)
+    inconsistent = sum(len({(r["label"], r["feedback"]) for r in rs if r["cached"]}) > 1 for rs in by_text.values())
+    raced = sum(sum(not r["cached"] for r in rs) > 1 for rs in by_text.values())
+    lookups = sum(len(rs) for rs in by_text.values())
+    upstream = mock.counts["requests"]
+
+    expected = {(w, j) for w in range(args.workers) for j in range(args.history)}
+    got = [(r["worker"], r["j"]) for r in loaded]
+
+    start = min(o["reserve_span"][0] for o in outs)
+    end = max(o["reserve_span"][1] for o in outs)
+    granted = sum(o["immediate"] for o in outs)
+    budget = LIMITER_RPM + LIMITER_RPM * (end - start) / 60 + 1
+
+    checks = {
+        "cache_consistent": inconsistent == 0,
+        "history_complete": len(got) == len(expected) and set(got) == expected,
+        "limiter_shared": granted <= budget,
+    }
+    report = {
+        "store": url.split(":")[0], "workers": args.workers, "wall_s": round(wall, 2),
+        "cache": {"lookups": lookups, "unique": len(by_text), "upstream_requests": upstream,
+                  "hit_ratio": round(1 - upstream / lookups, 3), "raced_submissions": raced,
+                  "inconsistent_submissions": inconsistent},
+        "history": {"appended": len(expected), "loaded": len(got), "distinct": len(set(got))},
+        "limiter": {"rpm": LIMITER_RPM, "reservations": args.workers * args.reserves,
+                    "granted_immediately": granted, "budget": round(budget, 1)},
+        "checks": checks,
+    }
+    print(json.dumps(report, indent=2))
+    return 0 if all(checks.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+# bench/resilience.py
+# Throttling and circuit-breaker behaviour against mock_azure's 429/5xx injection:
+#   retry_after   a 429's Retry-After is waited out before the retry
+#   opens         consecutive 5xx open the breaker; further calls fail fast
+#   half_open     after the reset timeout one trial goes through and closes it
+#   reopens       a failing trial opens it again
+#   cancelled     a trial that is cancelled mid-flight does not wedge the breaker
+#   client_error  a 400 (context length) is not retried; a packed batch splits at once
+# Exits 1 if a check fails.
+# Run: python bench/resilience.py
+from __future__ import annotations
+import asyncio, json, os, sys, time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+import mock_azure  # noqa: E402
+
+RESET_TIMEOUT = 1.0
+THRESHOLD = 3
+RETRY_AFTER_MS = 800
+
+
+class Mock(mock_azure.MockAzure):
+    """Records request times; `throttle_next` answers that many requests with 429."""
+
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        self.times = []
+        self.throttle_next = 0
+
+    def _count(self, key):
+        super()._count(key)
+        if key == "requests":
+            with self._lock:
+                self.times.append(time.monotonic())
+                if self.throttle_next > 0:
+                    self.throttle_next -= 1
+                    self.throttle_rate = 1.0
+                else:
+                    self.throttle_rate = 0.0
+
+
+def main():
+    mock = Mock(latency="const:0.05", retry_after_ms=RETRY_AFTER_MS).start()
+    os.environ.update(AZURE_ENDPOINT=mock.url, AZURE_API_KEY="bench", AZURE_DEPLOYMENT="mock",
+                      AZURE_API_VERSION="2024-06-01", LLM_CACHE_ENABLED="0", PRESCREEN_ENABLED="0",
+                      CIRCUIT_FAILURE_THRESHOLD=str(THRESHOLD), CIRCUIT_RESET_TIMEOUT=str(RESET_TIMEOUT))
+    import llm
+    breaker = llm.ROUTER.deployments[0].breaker
+    text = iter(f"corn fell from 130 to 80 and eggs rose, attempt {i}" for i in range(1000))
+
+    def call():
+        return llm.step_feedback("evidence", "agree", next(text))
+
+    checks, report = {}, {}
+
+    # 429 with Retry-After, then success
+    mock.throttle_next = 1
+    n0 = len(mock.times)
+    call()
+    gap = mock.times[n0 + 1] - mock.times[n0]
+    report["retry_after_gap_s"] = round(gap, 3)
+    checks["retry_after"] = gap >= RETRY_AFTER_MS / 1000
+
+    # consecutive 5xx open the breaker; the next call is rejected without a request
+    mock.error_rate = 1.0
+    while breaker.state != "open":
+        try:
+            call()
+        except llm.CircuitOpenError:
+            break
+        except Exception:
+            pass
+    n_open = len(mock.times)
+    try:
+        call()
+        rejected = False
+    except llm.CircuitOpenError:
+        rejected = True
+    checks["opens"] = breaker.state == "open" and rejected and len(mock.times) == n_open
+
+    # failing trial after the timeout: open again
+    time.sleep(RESET_TIMEOUT + 0.1)
+    try:
+        call()
+    except Exception:
+        pass
+    checks["reopens"] = breaker.state == "open"
+
+    # trial cancelled mid-flight, then a healthy upstream: must not stay stuck
+    mock.error_rate = 0.0
+    mock.latency = mock_azure.parse_latency("const:0.5")
+    time.sleep(RESET_TIMEOUT + 0.1)
+    fut = asyncio.run_coroutine_threadsafe(llm.astep_feedback("evidence", "agree", next(text)), llm._llm_loop())
+    time.sleep(0.2)
+    fut.cancel()
+    time.sleep(0.1)
+    report["state_after_cancel"] = breaker.state
+    mock.latency = mock_azure.parse_latency("const:0.05")
+    try:
+        call()
+        recovered = True
+    except llm.CircuitOpenError:
+        recovered = False
+    checks["cancelled"] = recovered
+    checks["half_open"] = recovered and breaker.state == "closed"
+
+    # 400 context_length_exceeded: one request, no retry; the batch halves instead
+    mock.max_prompt_tokens = 50
+    n0 = len(mock.times)
+    try:
+        call()
+        raised = False
+    except Exception:
+        raised = True
+    checks["client_error"] = raised and len(mock.times) - n0 == 1 and breaker.state == "closed"
+    texts = [next(text) * 10 for _ in range(8)]
+    single = llm._messages(*llm._build_step(llm.prompt_set(), "evidence", "agree", texts[0], ""))
+    mock.max_prompt_tokens = (sum(len(m["content"]) for m in single) + 2 * len(texts[0])) // 4  # ~3 per request
+    n0 = len(mock.times)
+    out = llm.step_feedback_batch("evidence", "agree", texts)
+    report["batch_requests"] = len(mock.times) - n0
+    report["batch_stats"] = llm.batch_stats()
+    checks["batch_splits"] = len(out) == 8 and report["batch_stats"]["splits"] > 0 and report["batch_requests"] < 8 * 3
+
+    report["requests"] = dict(mock.counts)
+    report["checks"] = checks
+    print(json.dumps(report, indent=2))
+    mock.stop()
+    return 0 if all(checks.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
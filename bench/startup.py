@@ -0,0 +1,82 @@
+# bench/startup.py
+# Cold-start cost of the data/figure section of app.py, each variant in a fresh
+# interpreter: legacy (import pandas + pyplot, build DataFrame, draw figure) vs
+# dataset.py with the PNG already on disk (the normal case after the first run
+# or `python -m dataset`). st.dataframe still turns the table dict into a pandas
+# DataFrame on first render, so the dataset variant pays that import too; the
+# PNG-only line shows what dataset.py alone costs.
+# Run: python bench/startup.py [-n 5]
+from __future__ import annotations
+import argparse, os, statistics, subprocess, sys, tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+LEGACY = r"""
+import time; t0 = time.perf_counter()
+import pandas as pd
+import matplotlib; matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import io
+df = pd.DataFrame({
+    "Year": [1, 2, 3, 4, 5],
+    "# of Corn Planted": [130, 130, 130, 130, 130],
+    "# of Corn Harvested": [130, 97, 91, 84, 80],
+    "Harvest Spiders": [0, 0, 10, 10, 10],
+    "Rootworms Eggs Initial": [0, 18, 29, 41, 41],
+    "Rootworms Eggs Final": [0, 53, 89, 89, 100],
+})
+palette = ["#4C78A8", "#72B7B2", "#A0A0A0", "#F2CF5B", "#E15759"]
+fig, ax = plt.subplots(figsize=(8.8, 4.6), dpi=120)
+x = df["Year"]
+for i, c in enumerate(list(df.columns)[1:]):
+    ax.plot(x, df[c], marker="o", label=c, color=palette[i])
+ax.legend(loc="upper center", bbox_to_anchor=(0.5, -0.22), ncol=3, frameon=False)
+plt.tight_layout()
+fig.savefig(io.BytesIO(), format="png")  # what st.pyplot does on every new process
+print(time.perf_counter() - t0)
+"""
+
+CACHED = r"""
+import time; t0 = time.perf_counter()
+import dataset
+table, png = dataset.TABLE, dataset.figure_png()
+print(time.perf_counter() - t0)
+"""
+
+# what app.py's first render pays: the cached path plus st.dataframe's dict -> DataFrame
+RENDERED = CACHED.replace("print(", """import pandas as pd
+pd.DataFrame(table)
+print(""")
+
+
+def timed(code, env, n):
+    out = []
+    for _ in range(n):
+        r = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+        if r.returncode:
+            raise SystemExit(r.stderr.strip().splitlines()[-1])
+        out.append(float(r.stdout.strip().splitlines()[-1]) * 1e3)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=5, help="fresh interpreters per variant")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        env = dict(os.environ, FIGURE_DIR=d, PYTHONDONTWRITEBYTECODE="1")
+        first = timed(CACHED, env, 1)[0]  # renders and writes the PNG
+        legacy = timed(LEGACY, env, args.n)
+        cached = timed(CACHED, env, args.n)
+        rendered = timed(RENDERED, env, args.n)
+
+    print(f"legacy (pandas+pyplot+draw):  {statistics.median(legacy):8.1f} ms")
+    print(f"dataset, first run (render):  {first:8.1f} ms")
+    print(f"dataset, PNG on disk:         {statistics.median(cached):8.1f} ms")
+    print(f"  + st.dataframe's pandas:    {statistics.median(rendered):8.1f} ms")
+    print(f"speedup (with pandas):        {statistics.median(legacy) / statistics.median(rendered):8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
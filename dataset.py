@@ -0,0 +1,83 @@
+# dataset.py
+# The yearly corn/rootworm table and its chart, kept free of heavy imports.
+#
+# The chart is rendered once to a PNG on disk and then served as bytes; matplotlib
+# is only imported when that file is missing or stale. Pre-build it at deploy time:
+#   python -m dataset            (writes FIGURE_DIR/figure-<hash>.png)
+from __future__ import annotations
+import hashlib, io, json, os, tempfile
+from typing import Dict, List, Optional
+
+# column -> values, in display order (st.dataframe takes this directly)
+TABLE: Dict[str, List[int]] = {
+    "Year": [1, 2, 3, 4, 5],
+    "# of Corn Planted": [130, 130, 130, 130, 130],
+    "# of Corn Harvested": [130, 97, 91, 84, 80],
+    "Harvest Spiders": [0, 0, 10, 10, 10],
+    "Rootworms Eggs Initial": [0, 18, 29, 41, 41],
+    "Rootworms Eggs Final": [0, 53, 89, 89, 100],
+}
+
+# (column, legend label, colour)
+SERIES = [
+    ("# of Corn Planted", "# of Corn Planted", "#4C78A8"),
+    ("# of Corn Harvested", "# of Corn Harvested", "#72B7B2"),
+    ("Harvest Spiders", "# Harvest Spiders", "#A0A0A0"),
+    ("Rootworms Eggs Initial", "# Rootworm Eggs Initial", "#F2CF5B"),
+    ("Rootworms Eggs Final", "# Rootworm Eggs Final", "#E15759"),
+]
+FIGSIZE, DPI = (8.8, 4.6), 120
+FIGURE_DIR = os.environ.get("FIGURE_DIR", ".cache")
+
+
+def figure_hash() -> str:
+    """Changes whenever the data or the chart styling changes."""
+    raw = json.dumps([TABLE, SERIES, FIGSIZE, DPI], sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def figure_path(directory: Optional[str] = None) -> str:
+    return os.path.join(directory or FIGURE_DIR, f"figure-{figure_hash()}.png")
+
+
+def render_png() -> bytes:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=FIGSIZE, dpi=DPI)
+    x = TABLE["Year"]
+    for col, label, color in SERIES:
+        ax.plot(x, TABLE[col], marker="o", label=label, color=color)
+    ax.set_xlabel("Year"); ax.set_ylabel("Count"); ax.set_xlim(1,5); ax.grid(alpha=.18)
+    ax.legend(loc="upper center", bbox_to_anchor=(0.5, -0.22), ncol=3, frameon=False)
+    fig.tight_layout()
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=DPI)
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def figure_png(directory: Optional[str] = None) -> bytes:
+    """Chart PNG bytes from disk, rendering (and saving) it first if needed."""
+    path = figure_path(directory)
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    png = render_png()
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    # write-then-rename so concurrent first runs never serve a half-written file
+    fd, tmp = tempfile.mkstemp(dir=d or ".", suffix=".png.tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(png)
+    os.replace(tmp, path)
+    return png
+
+
+if __name__ == "__main__":
+    figure_png()
+    print(figure_path())
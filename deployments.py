@@ -0,0 +1,135 @@
+# deployments.py
+# Several Azure OpenAI deployments behind one client: weighted, least-outstanding
+# routing with latency awareness, per-deployment throttling and failover.
+from __future__ import annotations
+import random, threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+import ratelimit
+from ratelimit import CircuitOpenError
+
+
+class Deployment:
+    """One endpoint/deployment pair plus its own limiter, breaker and stats."""
+
+    def __init__(self, name: str, endpoint: str, deployment: str, api_key: str, api_version: str,
+                 weight: float = 1.0, rpm: float = 0, tpm: float = 0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 limiter: Optional[ratelimit.AdaptiveRateLimiter] = None):
+        self.name = name
+        self.endpoint = (endpoint or "").rstrip("/")
+        self.deployment = deployment
+        self.api_key = api_key
+        self.api_version = api_version
+        self.weight = max(float(weight), 1e-6)
+        self.limiter = limiter or ratelimit.AdaptiveRateLimiter(rpm=rpm, tpm=tpm)
+        self.breaker = ratelimit.CircuitBreaker(failure_threshold, reset_timeout)
+        self._lock = threading.Lock()
+        self.outstanding = 0
+        self.calls = 0
+        self.errors = 0
+        self.throttled = 0
+        self.ewma_latency: Optional[float] = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key and self.endpoint and self.deployment)
+
+    @property
+    def url(self) -> str:
+        return (f"{self.endpoint}/openai/deployments/{self.deployment}"
+                f"/chat/completions?api-version={self.api_version}")
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Content-Type": "application/json", "api-key": self.api_key}
+
+    def begin(self) -> None:
+        with self._lock:
+            self.outstanding += 1
+            self.calls += 1
+
+    def end(self, latency: Optional[float] = None, status: Optional[int] = None, error: bool = False) -> None:
+        with self._lock:
+            self.outstanding -= 1
+            if error:
+                self.errors += 1
+            if status == 429:
+                self.throttled += 1
+            if latency is not None and not error:
+                a = 0.2
+                self.ewma_latency = latency if self.ewma_latency is None else (1 - a) * self.ewma_latency + a * latency
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = {
+                "endpoint": self.endpoint, "deployment": self.deployment, "weight": self.weight,
+                "outstanding": self.outstanding, "calls": self.calls, "errors": self.errors,
+                "throttled": self.throttled, "ewma_latency_s": self.ewma_latency,
+            }
+        out["limiter"] = self.limiter.stats()
+        out["breaker"] = self.breaker.stats()
+        return out
+
+
+class Router:
+    """Picks the deployment with the lowest (outstanding+1)/weight x expected latency.
+
+    Deployments whose breaker is open are skipped; callers pass the ones that
+    already failed this request in `exclude` to fail over to the next best.
+    """
+
+    def __init__(self, deployments: Iterable[Deployment]):
+        self.deployments: List[Deployment] = list(deployments)
+        self._lock = threading.Lock()
+
+    def _score(self, d: Deployment, default_latency: float) -> float:
+        lat = d.ewma_latency if d.ewma_latency is not None else default_latency
+        return (d.outstanding + 1) / d.weight * lat
+
+    def pick(self, exclude: Iterable[Deployment] = ()) -> Deployment:
+        """Reserve the best available deployment (its breaker has admitted the call)."""
+        skip = set(id(d) for d in exclude)
+        with self._lock:
+            known = [d.ewma_latency for d in self.deployments if d.ewma_latency is not None]
+            default_latency = sum(known) / len(known) if known else 1.0
+            pool = [d for d in self.deployments if id(d) not in skip] or list(self.deployments)
+            random.shuffle(pool)  # break ties between equally idle deployments
+            pool.sort(key=lambda d: self._score(d, default_latency))
+            soonest = None
+            for d in pool:
+                try:
+                    d.breaker.check()
+                except CircuitOpenError as e:
+                    soonest = e if soonest is None or e.retry_in < soonest.retry_in else soonest
+                    continue
+                d.begin()
+                return d
+        raise soonest or CircuitOpenError(0)
+
+    def has_alternative(self, exclude: Iterable[Deployment]) -> bool:
+        skip = set(id(d) for d in exclude)
+        return any(id(d) not in skip and d.breaker.stats()["state"] != "open" for d in self.deployments)
+
+    def stats(self) -> Dict[str, Dict]:
+        return {d.name: d.stats() for d in self.deployments}
+
+
+def from_config(entries, defaults: Dict, limiter: Optional[Callable] = None) -> List[Deployment]:
+    """Build deployments from a list of dicts; missing keys fall back to `defaults`.
+
+    `limiter(name, rpm, tpm)`, if given, builds each deployment's rate limiter
+    (e.g. a ratelimit.SharedRateLimiter so replicas share one budget).
+    """
+    out = []
+    for i, e in enumerate(entries or []):
+        e = dict(e)
+        merged = {k: e.get(k, defaults.get(k)) for k in
+                  ("endpoint", "deployment", "api_key", "api_version", "weight", "rpm", "tpm",
+                   "failure_threshold", "reset_timeout")}
+        merged = {k: v for k, v in merged.items() if v is not None}
+        name = str(e.get("name") or f"d{i}")
+        if limiter is not None:
+            merged["limiter"] = limiter(name, merged.get("rpm", 0), merged.get("tpm", 0))
+        out.append(Deployment(name=name, **merged))
+    return out
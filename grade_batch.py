@@ -0,0 +1,198 @@
+# grade_batch.py
+# Offline regrading of a whole class: stream rows from CSV/JSONL, grade them with
+# llm.step_feedback in parallel, append results to a JSONL file as they finish.
+#
+# Run: python -m grade_batch submissions.csv -o results.jsonl [--workers 8] [--batch 10] [--secrets .streamlit/secrets.toml]
+#
+# Input rows need `claim` (agree/disagree), `evidence` and optionally `reasoning`
+# and `id`. Re-running with the same output file resumes: rows already written
+# without an error are skipped, and identical submissions are only sent once.
+# --batch N packs up to N rows per claim side into one request (llm.step_feedback_batch).
+from __future__ import annotations
+import argparse, csv, hashlib, json, os, sys, threading, time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterator, Optional
+
+
+def iter_rows(path: str) -> Iterator[Dict]:
+    """Yield input rows one at a time, numbered from 0 in file order."""
+    if path.endswith((".jsonl", ".ndjson")):
+        with open(path, "r", encoding="utf-8") as f:
+            n = 0
+            for line in f:
+                if line.strip():
+                    yield dict(json.loads(line), _row=n)
+                    n += 1
+    else:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            for n, row in enumerate(csv.DictReader(f)):
+                yield dict(row, _row=n)
+
+
+def _norm(s) -> str:
+    return " ".join(str(s or "").split())
+
+
+def submission_key(claim: str, evidence: str, reasoning: str) -> str:
+    raw = json.dumps([claim, _norm(evidence), _norm(reasoning)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def load_checkpoint(out_path: str):
+    """(rows done, results by submission key) from a previous run's output."""
+    done, by_key = set(), {}
+    if not os.path.exists(out_path):
+        return done, by_key
+    with open(out_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line from a crash
+            if rec.get("error"):
+                continue
+            done.add(rec["row"])
+            by_key[rec["key"]] = rec["result"]
+    return done, by_key
+
+
+def grade(llm, claim: str, evidence: str, reasoning: str) -> Dict:
+    ev = llm.step_feedback("evidence", claim, evidence)
+    out = {"evidence": _fields(ev)}
+    if _norm(reasoning):
+        rs = llm.step_feedback("reasoning", claim, reasoning, evidence_text=evidence)
+        out["reasoning"] = _fields(rs)
+    out["prompt_version"] = ev.get("prompt_version")
+    return out
+
+
+def _fields(res: Dict) -> Dict:
+    return {k: res.get(k) for k in ("label", "step_feedback", "confidence")}
+
+
+def grade_many(llm, items) -> None:
+    """grade() for a chunk of (claim, evidence, reasoning, future) rows using packed requests."""
+    by_claim: Dict[str, list] = {}
+    for item in items:
+        by_claim.setdefault(item[0], []).append(item)
+    for claim, group in by_claim.items():
+        try:
+            evs = llm.step_feedback_batch("evidence", claim, [g[1] for g in group], return_exceptions=True)
+            todo = [(g, ev) for g, ev in zip(group, evs) if not isinstance(ev, Exception) and _norm(g[2])]
+            rss = llm.step_feedback_batch("reasoning", claim, [g[2] for g, _ in todo],
+                                          evidence_texts=[g[1] for g, _ in todo], return_exceptions=True)
+        except Exception as e:
+            for g in group:
+                if not g[3].done():
+                    g[3].set_exception(e)
+            continue
+        reasoning = {id(g): rs for (g, _), rs in zip(todo, rss)}
+        for g, ev in zip(group, evs):
+            rs = reasoning.get(id(g))
+            if isinstance(ev, Exception) or isinstance(rs, Exception):
+                g[3].set_exception(ev if isinstance(ev, Exception) else rs)
+                continue
+            out = {"evidence": _fields(ev)}
+            if rs is not None:
+                out["reasoning"] = _fields(rs)
+            out["prompt_version"] = ev.get("prompt_version")
+            g[3].set_result(out)
+
+
+def run(args) -> Dict:
+    if args.secrets:
+        os.environ["LLM_SECRETS_FILE"] = args.secrets
+    if args.prompt_version:
+        os.environ["PROMPT_VERSION"] = args.prompt_version
+    if args.batch > 1:
+        os.environ["LLM_BATCH_MAX_ITEMS"] = str(args.batch)
+    import llm  # after the env above is set; llm reads config at import
+
+    done, by_key = load_checkpoint(args.output)
+    stats = {"rows": 0, "skipped": 0, "deduped": 0, "graded": 0, "errors": 0}
+    inflight: Dict[str, Future] = {}
+    lock = threading.Lock()
+    window = threading.BoundedSemaphore(args.workers * max(4, 2 * args.batch))  # rows buffered ahead of the workers
+    chunk: list = []  # rows waiting to fill a --batch request
+    out = open(args.output, "a", encoding="utf-8")
+
+    def write(rec: Dict) -> None:
+        with lock:
+            out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            out.flush()
+
+    def finish(row: Dict, key: str, fut: Future) -> None:
+        rec = {"row": row["_row"], "id": row.get("id"), "key": key, "claim": row.get("claim")}
+        try:
+            rec["result"] = fut.result()
+        except Exception as e:
+            rec["error"] = f"{type(e).__name__}: {e}"
+            with lock:
+                stats["errors"] += 1
+        write(rec)
+        window.release()
+
+    t0 = time.time()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for row in iter_rows(args.input):
+            stats["rows"] += 1
+            if row["_row"] in done:
+                stats["skipped"] += 1
+                continue
+            claim = _norm(row.get("claim")).lower()
+            evidence, reasoning = row.get("evidence") or "", row.get("reasoning") or ""
+            key = submission_key(claim, evidence, reasoning)
+            if not window.acquire(blocking=False):
+                if chunk:  # slots held by unsent rows (and their duplicates) only free once the chunk is sent
+                    pool.submit(grade_many, llm, chunk)
+                    chunk = []
+                window.acquire()
+            if key in by_key:
+                stats["deduped"] += 1
+                fut = Future()
+                fut.set_result(by_key[key])
+            elif key in inflight:
+                stats["deduped"] += 1
+                fut = inflight[key]
+            else:
+                if claim not in ("agree", "disagree"):
+                    fut = Future()
+                    fut.set_exception(ValueError(f"claim must be agree/disagree, got {row.get('claim')!r}"))
+                else:
+                    stats["graded"] += 1
+                    if args.batch > 1:
+                        fut = inflight[key] = Future()
+                        chunk.append((claim, evidence, reasoning, fut))
+                        if len(chunk) >= args.batch * 2:  # both claim sides usually fill a request
+                            pool.submit(grade_many, llm, chunk)
+                            chunk = []
+                    else:
+                        fut = inflight[key] = pool.submit(grade, llm, claim, evidence, reasoning)
+            fut.add_done_callback(lambda f, row=row, key=key: finish(row, key, f))
+        if chunk:
+            pool.submit(grade_many, llm, chunk)
+    out.close()
+    stats["seconds"] = round(time.time() - t0, 2)
+    stats["cache"] = llm.cache_stats()
+    stats["prescreen"] = llm.prescreen_stats()
+    if args.batch > 1:
+        stats["batch"] = llm.batch_stats()
+    return stats
+
+
+def main(argv: Optional[list] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m grade_batch", description="Regrade CSV/JSONL submissions offline.")
+    ap.add_argument("input", help="CSV or JSONL with claim, evidence[, reasoning, id]")
+    ap.add_argument("-o", "--output", required=True, help="results JSONL (appended; also the resume checkpoint)")
+    ap.add_argument("-w", "--workers", type=int, default=8, help="concurrent grading calls")
+    ap.add_argument("--secrets", help="TOML file with AZURE_* settings (e.g. .streamlit/secrets.toml)")
+    ap.add_argument("--batch", type=int, default=0, help="pack up to N submissions per request (0 = one call each)")
+    ap.add_argument("--prompt-version", help="grade with this prompts/ version (default: PROMPT_VERSION or newest)")
+    args = ap.parse_args(argv)
+    stats = run(args)
+    print(json.dumps(stats), file=sys.stderr)
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+# history_store.py
+# Durable attempt history (evidence/reasoning records) outside st.session_state.
+# Appends go through a background write-behind queue and are batch-committed to
+# SQLite, so a "Get feedback" click never waits on disk. Replicas pointed at the
+# same file (or a Redis shared_store, see SharedHistory) see each other's sessions.
+from __future__ import annotations
+import atexit, json, os, queue, sqlite3, threading, time
+from typing import Dict, List, Optional, Tuple
+
+KINDS = ("evidence", "reasoning")
+
+
+def _window(total: int, before: Optional[int], limit: int) -> Tuple[int, int]:
+    hi = total if before is None else max(0, min(before, total))
+    return max(0, hi - limit), hi
+
+
+class HistoryStore:
+    """One per process; safe to share across Streamlit sessions/threads."""
+
+    def __init__(self, path: str, batch_size: int = 64, flush_interval: float = 0.25):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._q: "queue.Queue[Optional[Tuple[str, str, Dict]]]" = queue.Queue()
+        self._pending: Dict[str, List[Tuple[str, Dict]]] = {}  # queued, not yet committed
+        self._lock = threading.Lock()     # _pending + counters; never held across disk I/O
+        self._db_lock = threading.Lock()  # the connection; commit+unpend and select+snapshot are atomic
+        self._closed = False
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self._db = self._connect()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS attempts ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL,"
+            " kind TEXT NOT NULL, claim TEXT, ts TEXT, record TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS attempts_session ON attempts(session_id, id)")
+        self._db.commit()
+        self._writer = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    # ---- write path ----
+    def append(self, session_id: str, kind: str, record: Dict) -> None:
+        """Queue one attempt record; returns immediately."""
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {KINDS}, got {kind!r}")
+        item = (session_id, kind, dict(record))
+        with self._lock:
+            self._pending.setdefault(session_id, []).append((kind, item[2]))
+        self._q.put(item)
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            try:
+                first = self._q.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            if first is None:
+                stop = True
+            else:
+                batch.append(first)
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                self._commit(batch)
+
+    def _commit(self, batch) -> None:
+        """Insert one batch, retrying with backoff while another process holds the
+        database lock; until then the records stay pending (load() still sees them)."""
+        rows = [(sid, kind, rec.get("claim"), rec.get("ts"), json.dumps(rec, ensure_ascii=False))
+                for sid, kind, rec in batch]
+        attempt = 0
+        while True:
+            with self._db_lock:
+                try:
+                    with self._db:
+                        self._db.executemany(
+                            "INSERT INTO attempts(session_id, kind, claim, ts, record) VALUES (?, ?, ?, ?, ?)", rows)
+                except sqlite3.OperationalError:  # database locked by another process
+                    pass
+                else:
+                    with self._lock:
+                        self.written += len(rows)
+                        self.batches += 1
+                        self.retries += attempt
+                        for sid, kind, rec in batch:
+                            pend = self._pending.get(sid)
+                            if pend:
+                                pend.remove((kind, rec))
+                                if not pend:
+                                    del self._pending[sid]
+                    return
+            attempt += 1
+            time.sleep(min(0.1 * attempt, 2.0))  # outside _db_lock, so readers aren't held up
+
+    # ---- read path ----
+    def load(self, session_id: str) -> Dict[str, List[Dict]]:
+        """All attempts for a session, oldest first, including ones still queued."""
+        out: Dict[str, List[Dict]] = {k: [] for k in KINDS}
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT kind, record FROM attempts WHERE session_id = ? ORDER BY id", (session_id,)
+            ).fetchall()
+            with self._lock:
+                pending = list(self._pending.get(session_id, ()))
+        for kind, raw in rows:
+            out.setdefault(kind, []).append(json.loads(raw))
+        for kind, rec in pending:
+            out.setdefault(kind, []).append(dict(rec))
+        return out
+
+    def counts(self, session_id: str) -> Dict[str, Dict[str, int]]:
+        """{kind: {claim: number of attempts}} for a session, including ones still queued."""
+        out: Dict[str, Dict[str, int]] = {k: {} for k in KINDS}
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT kind, COALESCE(claim, ''), COUNT(*) FROM attempts WHERE session_id = ? GROUP BY 1, 2",
+                (session_id,)).fetchall()
+            with self._lock:
+                pending = list(self._pending.get(session_id, ()))
+        for kind, claim, n in rows:
+            out.setdefault(kind, {})[claim] = n
+        for kind, rec in pending:
+            claim, per = rec.get("claim") or "", out.setdefault(kind, {})
+            per[claim] = per.get(claim, 0) + 1
+        return out
+
+    def page(self, session_id: str, kind: str, claim: str, before: Optional[int] = None,
+             limit: int = 20) -> Tuple[int, List[Dict]]:
+        """Up to `limit` attempts of one kind and claim that come before position `before`
+        (0-based, oldest first; default: the newest ones). Returns (position of the first, records)."""
+        where = "session_id = ? AND kind = ? AND COALESCE(claim, '') = ?"
+        args = (session_id, kind, claim or "")
+        with self._db_lock:
+            committed = self._db.execute(f"SELECT COUNT(*) FROM attempts WHERE {where}", args).fetchone()[0]
+            with self._lock:
+                pending = [dict(rec) for k, rec in self._pending.get(session_id, ())
+                           if k == kind and (rec.get("claim") or "") == (claim or "")]
+            lo, hi = _window(committed + len(pending), before, limit)
+            rows = self._db.execute(f"SELECT record FROM attempts WHERE {where} ORDER BY id LIMIT ? OFFSET ?",
+                                    args + (max(0, min(hi, committed) - lo), lo)).fetchall()
+        return lo, [json.loads(raw) for raw, in rows] + pending[max(0, lo - committed):max(0, hi - committed)]
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Block until everything queued so far is committed (tests/shutdown)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._pending:
+                    return
+            time.sleep(0.02)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._q.put(None)
+        self._writer.join(timeout=5)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"written": self.written, "batches": self.batches, "retries": self.retries,
+                    "queued": self._q.qsize(), "pending_sessions": len(self._pending)}
+
+
+class SharedHistory:
+    """HistoryStore's interface on a shared_store list per session (Redis).
+
+    An append is one RPUSH, cheap enough to do inline, so there is no queue and
+    a session that moves to another replica sees every committed attempt.
+    """
+
+    def __init__(self, store, prefix: str = "history:"):
+        self.store = store
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.written = 0
+
+    def append(self, session_id: str, kind: str, record: Dict) -> None:
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {KINDS}, got {kind!r}")
+        self.store.rpush(self.prefix + session_id, json.dumps({"kind": kind, "record": record}, ensure_ascii=False))
+        with self._lock:
+            self.written += 1
+
+    def load(self, session_id: str) -> Dict[str, List[Dict]]:
+        out: Dict[str, List[Dict]] = {k: [] for k in KINDS}
+        for raw in self.store.lrange(self.prefix + session_id):
+            item = json.loads(raw)
+            out.setdefault(item["kind"], []).append(item["record"])
+        return out
+
+    # one list per session, so these read it whole; it holds a single student's attempts
+    def counts(self, session_id: str) -> Dict[str, Dict[str, int]]:
+        out: Dict[str, Dict[str, int]] = {k: {} for k in KINDS}
+        for kind, recs in self.load(session_id).items():
+            for rec in recs:
+                claim, per = rec.get("claim") or "", out.setdefault(kind, {})
+                per[claim] = per.get(claim, 0) + 1
+        return out
+
+    def page(self, session_id: str, kind: str, claim: str, before: Optional[int] = None,
+             limit: int = 20) -> Tuple[int, List[Dict]]:
+        recs = [r for r in self.load(session_id).get(kind, []) if (r.get("claim") or "") == (claim or "")]
+        lo, hi = _window(len(recs), before, limit)
+        return lo, recs[lo:hi]
+
+    def flush(self, timeout: float = 5.0) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"written": self.written, "batches": self.written, "queued": 0, "pending_sessions": 0}
+
+
+def open_history(store=None, path: str = ".cache/history.sqlite"):
+    """History for this process: the shared SQLite file, SharedHistory on Redis, else `path`."""
+    if store is None:
+        return HistoryStore(path)
+    if getattr(store, "path", None):
+        return HistoryStore(store.path)  # own table in the shared file, keeps the write-behind queue
+    return SharedHistory(store)
@@ -1,126 +1,1004 @@
 # llm.py  
 # (evidence + reasoning only)
 from __future__ import annotations
-import json, re, time, os
-from typing import Dict, Optional
+import asyncio, collections, concurrent.futures, hashlib, json, re, sys, time, os, threading
+from typing import Awaitable, Dict, Iterator, Optional, Sequence, Tuple, TypeVar, Union
+import httpx
 import requests
-import yaml
-import streamlit as st
+from requests.adapters import HTTPAdapter
 
+import dataset
+import deployments
+import llm_cache
+import llm_json
+import llm_prompts
+import metrics
+import prescreen
+import ratelimit
+import shared_store
 
-AZURE_API_KEY = st.secrets["AZURE_API_KEY"]
-AZURE_ENDPOINT = st.secrets["AZURE_ENDPOINT"]
-AZURE_DEPLOYMENT = st.secrets["AZURE_DEPLOYMENT"]
-AZURE_API_VERSION = st.secrets["AZURE_API_VERSION"]
+CircuitOpenError = ratelimit.CircuitOpenError  # re-exported: app.py catches llm.CircuitOpenError
+
+
+# Config sources, in order: st.secrets (only when already running under Streamlit;
+# llm never imports it, so CLI/worker processes stay Streamlit-free), env vars,
+# then the TOML file named by LLM_SECRETS_FILE (same format as .streamlit/secrets.toml).
+def _streamlit_secrets():
+    st = sys.modules.get("streamlit")
+    if st is None:
+        return None
+    try:
+        st.secrets.get("AZURE_API_KEY")  # raises if no secrets file
+        return st.secrets
+    except Exception:
+        return None
+
+def _file_secrets() -> Dict:
+    path = os.environ.get("LLM_SECRETS_FILE")
+    if not path:
+        return {}
+    import tomllib
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+_ST_SECRETS = _streamlit_secrets()
+_FILE_SECRETS = _file_secrets()
+
+def _setting(name: str, default):
+    """Config value from st.secrets / env / LLM_SECRETS_FILE, else default."""
+    val = _ST_SECRETS.get(name) if _ST_SECRETS is not None else None
+    if val is None:
+        val = os.environ.get(name)
+    if val is None:
+        val = _FILE_SECRETS.get(name)
+    if val is None:
+        return default
+    if isinstance(default, bool):
+        return str(val).strip().lower() in ("1", "true", "yes", "on")
+    return type(default)(val) if default is not None else val
+
+AZURE_API_KEY = _setting("AZURE_API_KEY", "")
+AZURE_ENDPOINT = _setting("AZURE_ENDPOINT", "")
+AZURE_DEPLOYMENT = _setting("AZURE_DEPLOYMENT", "")
+AZURE_API_VERSION = _setting("AZURE_API_VERSION", "")
+# optional list of {name, endpoint, deployment, api_key, api_version, weight, rpm, tpm}
+# (TOML array of tables in secrets, or JSON in the env var); missing keys fall back
+# to the single AZURE_* values above
+AZURE_DEPLOYMENTS = _setting("AZURE_DEPLOYMENTS", None)
+
+# connection pool sizing for the shared HTTP client (per process)
+HTTP_POOL_CONNECTIONS = _setting("HTTP_POOL_CONNECTIONS", 4)
+HTTP_POOL_MAXSIZE = _setting("HTTP_POOL_MAXSIZE", 32)
+HTTP_POOL_BLOCK = _setting("HTTP_POOL_BLOCK", False)
+# cap on in-flight Azure requests per process for the async path
+LLM_MAX_CONCURRENCY = _setting("LLM_MAX_CONCURRENCY", 16)
+# client-side throttling per deployment (0 disables a bucket) and circuit breaker
+AZURE_RPM = _setting("AZURE_RPM", 300.0)
+AZURE_TPM = _setting("AZURE_TPM", 150000.0)
+AZURE_MAX_COMPLETION_TOKENS_EST = _setting("AZURE_MAX_COMPLETION_TOKENS_EST", 300)
+CIRCUIT_FAILURE_THRESHOLD = _setting("CIRCUIT_FAILURE_THRESHOLD", 5)
+CIRCUIT_RESET_TIMEOUT = _setting("CIRCUIT_RESET_TIMEOUT", 30.0)
+# stream feedback into the UI as it is generated (SSE); AZURE_STREAM_USAGE asks the
+# service for a trailing usage chunk (stream_options). Unset = on for deployments whose
+# api-version supports it (2024-09-01 and later), so streamed calls are token-accounted
+STREAM_FEEDBACK = _setting("STREAM_FEEDBACK", True)
+AZURE_STREAM_USAGE = _setting("AZURE_STREAM_USAGE", None)
+# response cache (empty LLM_CACHE_PATH = memory only)
+LLM_CACHE_ENABLED = _setting("LLM_CACHE_ENABLED", True)
+LLM_CACHE_PATH = _setting("LLM_CACHE_PATH", ".cache/llm_cache.sqlite")
+LLM_CACHE_MAX_ENTRIES = _setting("LLM_CACHE_MAX_ENTRIES", 2048)
+LLM_CACHE_DISK_MAX_ENTRIES = _setting("LLM_CACHE_DISK_MAX_ENTRIES", 50000)
+LLM_CACHE_TTL = _setting("LLM_CACHE_TTL", 7 * 24 * 3600.0)
+
+# local pre-screen of empty/short/off-topic submissions (see prescreen.py); a sampled
+# PRESCREEN_SHADOW_RATE of screened ones is also sent to the model to measure agreement
+# (prescreen_stats), so keep it above 0 while the screen is on
+PRESCREEN_ENABLED = _setting("PRESCREEN_ENABLED", True)
+PRESCREEN_MIN_CHARS = _setting("PRESCREEN_MIN_CHARS", 12)
+PRESCREEN_MIN_WORDS = _setting("PRESCREEN_MIN_WORDS", 3)
+PRESCREEN_REQUIRE_NUMBERS = _setting("PRESCREEN_REQUIRE_NUMBERS", False)
+PRESCREEN_SHADOW_RATE = _setting("PRESCREEN_SHADOW_RATE", 0.1)
+
+# one corrective re-ask when the reply has no recoverable JSON object / valid label
+LLM_JSON_REASK = _setting("LLM_JSON_REASK", True)
+
+# per-call records: METRICS_JSONL appends each one to a file; METRICS_PORT serves
+# /metrics (Prometheus text) and /metrics.jsonl from this process
+METRICS_JSONL = _setting("METRICS_JSONL", "")
+METRICS_PORT = _setting("METRICS_PORT", 0)
+
+# grade reasoning in the background while evidence is checked (see ReasoningSpeculator);
+# a session stops speculating after SPECULATIVE_MAX_WASTE discarded results; the evidence
+# click waits at most SPECULATIVE_TAKE_WAIT s for it, else it is picked up on a later rerun
+SPECULATIVE_REASONING = _setting("SPECULATIVE_REASONING", False)
+SPECULATIVE_MAX_WASTE = _setting("SPECULATIVE_MAX_WASTE", 3)
+SPECULATIVE_TAKE_WAIT = _setting("SPECULATIVE_TAKE_WAIT", 0.5)
+
+# every *.yml in PROMPTS_DIR is served, keyed by its `version:`. PROMPT_VERSION is
+# the default (empty = newest), PROMPT_SPLIT assigns sessions by weight
+# ("v3.0:90,v3.1:10"), edits are picked up within PROMPT_RELOAD_INTERVAL s (0 = off)
+PROMPTS_DIR = _setting("PROMPTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts"))
+PROMPT_VERSION = _setting("PROMPT_VERSION", "")
+PROMPT_SPLIT = _setting("PROMPT_SPLIT", "")
+PROMPT_RELOAD_INTERVAL = _setting("PROMPT_RELOAD_INTERVAL", 2.0)
+
+# step_feedback_batch: submissions per packed request, and the budget (prompt +
+# expected completions, in estimated tokens) a packed request must stay under
+LLM_BATCH_MAX_ITEMS = _setting("LLM_BATCH_MAX_ITEMS", 10)
+LLM_BATCH_MAX_TOKENS = _setting("LLM_BATCH_MAX_TOKENS", 12000)
+
+# state shared by every replica (see shared_store): sqlite:///path or redis://host:port/db.
+# Holds the response cache, the per-deployment rate limits and session history;
+# empty keeps all of them per process
+SHARED_STORE_URL = _setting("SHARED_STORE_URL", "")
+# on a shared miss, wait up to this long for a replica already grading the same answer
+LLM_SHARED_LEASE = _setting("LLM_SHARED_LEASE", 30.0)
 
 EVIDENCE_LABELS = {"supportive", "non_supportive"}
 REASONING_LABELS = {"valid", "alternative"}
+_LABELS = {"evidence": EVIDENCE_LABELS, "reasoning": REASONING_LABELS}
 
 # ---------------- Prompts ----------------
-def load_prompts(path: str = "prompts/v3.0.yml") -> Dict:
-    with open(path, "r", encoding="utf-8") as f:
-        conf = yaml.safe_load(f)
-    return conf or {}
+# Each file is compiled once per change (llm_prompts.PromptSet: every (component,
+# claim_side) system prompt + user template). A call resolves its PromptSet up
+# front and uses only that, so a reload mid-call never mixes versions.
+# Raises llm_prompts.PromptConfigError at import if no file compiles.
+PROMPT_REGISTRY = llm_prompts.PromptRegistry(PROMPTS_DIR, default=PROMPT_VERSION, split=PROMPT_SPLIT,
+                                             check_interval=PROMPT_RELOAD_INTERVAL)
+
+def load_prompts(path: Optional[str] = None) -> Dict:
+    return llm_prompts.read_prompts(path)[0] if path else prompt_set().conf
+
+def _prompts_changed() -> None:
+    if CACHE is not None:
+        CACHE.retain(ps.hash for ps in PROMPT_REGISTRY.sets().values())
+
+def reload_prompts() -> bool:
+    """Re-read prompts/ now; True if any version was added, changed or removed."""
+    changed = PROMPT_REGISTRY.reload()
+    if changed:
+        _prompts_changed()
+    return changed
+
+def _maybe_reload() -> None:
+    if PROMPT_RELOAD_INTERVAL > 0 and PROMPT_REGISTRY.maybe_reload():
+        _prompts_changed()
+
+def prompt_set(version: Optional[str] = None) -> llm_prompts.PromptSet:
+    """Compiled prompts for `version` (default if None or no longer present)."""
+    _maybe_reload()
+    if version and version not in PROMPT_REGISTRY.sets():
+        version = None
+    return PROMPT_REGISTRY.get(version)
+
+def session_prompt_version(session_id: str, pin: Optional[str] = None) -> str:
+    """Version for a new session: a valid `pin` wins, else its PROMPT_SPLIT bucket."""
+    _maybe_reload()
+    if pin and pin in PROMPT_REGISTRY.sets():
+        return pin
+    return PROMPT_REGISTRY.assign(session_id)
+
+def prompt_stats() -> Dict:
+    _maybe_reload()
+    return PROMPT_REGISTRY.stats()
+
+# ---------------- Shared store ----------------
+SHARED_STORE = shared_store.open_store(SHARED_STORE_URL)
+
+# ---------------- Response cache ----------------
+CACHE = llm_cache.ResponseCache(
+    LLM_CACHE_PATH or None, [ps.hash for ps in PROMPT_REGISTRY.sets().values()],
+    max_entries=LLM_CACHE_MAX_ENTRIES,
+    disk_max_entries=LLM_CACHE_DISK_MAX_ENTRIES,
+    ttl=LLM_CACHE_TTL,
+    store=SHARED_STORE,
+) if LLM_CACHE_ENABLED else None
+
+def _cache_key(ps, component, claim_side, student_text, evidence_text, temperature) -> Optional[str]:
+    if CACHE is None:
+        return None
+    return llm_cache.make_key(ps.version, ps.hash, component, claim_side,
+                              student_text, evidence_text if component == "reasoning" else "", temperature)
+
+def _cache_get(key: Optional[str]) -> Optional[Dict]:
+    if key is None:
+        return None
+    out = CACHE.get(key)
+    if out is not None:
+        out["cached"] = True
+    return out
+
+def _cache_put(ps, key: Optional[str], component: str, out: Dict) -> None:
+    # only cache results the app would accept
+    if key is not None and out.get("label") in _LABELS.get(component, ()):
+        CACHE.put(key, out, ps.hash)
+
+def _await_peer(key: Optional[str]) -> Tuple[Optional[Dict], Optional[str]]:
+    """Shared cache only: (the answer another replica produced for `key`, None), else
+    (None, the lease to pass to _cache_release: `key` if this replica now holds it,
+    None if it doesn't, e.g. the wait timed out, so another replica's lease is kept)."""
+    if key is None:
+        return None, None
+    out, held = CACHE.await_peer(key, LLM_SHARED_LEASE)
+    if out is not None:
+        out["cached"] = True
+    return out, key if held else None
+
+def _cache_release(key: Optional[str]) -> None:
+    if key is not None:
+        CACHE.release(key)
+
+def cache_stats() -> Dict:
+    return CACHE.stats() if CACHE is not None else {}
+
+# ---------------- Metrics ----------------
+if METRICS_JSONL:
+    metrics.REGISTRY.add_hook(metrics.JsonlSink(METRICS_JSONL))
+if METRICS_PORT:
+    try:
+        metrics.serve(METRICS_PORT)
+    except OSError:
+        pass  # already served by an earlier import in this process (e.g. Streamlit module reload)
+
+def _observed(ps, out: Dict, outcome: Optional[str] = None) -> Dict:
+    """Tag a result with the prompt version that produced it and note it on the call record."""
+    out["prompt_version"] = ps.version
+    metrics.note(label=out.get("label"), confidence=out.get("confidence"), prompt_version=ps.version)
+    if outcome:
+        metrics.note(outcome=outcome)
+    return out
+
+# ---------------- HTTP client ----------------
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def _http() -> requests.Session:
+    """Process-wide keep-alive session, shared by every Streamlit session/thread."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                sess = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS,
+                                      pool_maxsize=HTTP_POOL_MAXSIZE,
+                                      pool_block=HTTP_POOL_BLOCK)
+                sess.mount("https://", adapter)
+                sess.mount("http://", adapter)
+                _session = sess
+    return _session
+
+def pool_stats() -> Dict:
+    """Open/idle connections and reuse ratio across all pooled hosts."""
+    out = {"hosts": 0, "open": 0, "idle": 0, "opened_total": 0, "requests": 0, "reuse_ratio": 0.0}
+    if _session is None:
+        return out
+    seen = set()
+    for adapter in _session.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            q = pool.pool
+            if q is None:  # pool closed
+                continue
+            idle = sum(1 for c in list(q.queue) if c is not None)
+            out["hosts"] += 1
+            out["idle"] += idle
+            out["open"] += idle + (q.maxsize - q.qsize())  # idle + checked out
+            out["opened_total"] += pool.num_connections
+            out["requests"] += pool.num_requests
+    if out["requests"]:
+        out["reuse_ratio"] = 1.0 - out["opened_total"] / out["requests"]
+    return out
+
+# ---------------- Async client ----------------
+# One event loop per process, on a daemon thread. The async client lives there,
+# so every caller shares it no matter which thread (Streamlit script, worker
+# pool, other loop) it comes from. _SLOTS caps requests in flight across the
+# sync, streaming and async paths together.
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_loop_lock = threading.Lock()
+_aclient: Optional[httpx.AsyncClient] = None
+
+def _llm_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _loop_thread
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                _loop_thread = threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True)
+                _loop_thread.start()
+                _loop = loop
+    return _loop
+
+def _async_http() -> httpx.AsyncClient:
+    """Shared async client; only call from the llm loop."""
+    global _aclient
+    if _aclient is None:
+        _aclient = httpx.AsyncClient(limits=httpx.Limits(
+            max_connections=HTTP_POOL_MAXSIZE,
+            max_keepalive_connections=HTTP_POOL_MAXSIZE,
+        ))
+    return _aclient
+
+class _Slots:
+    """LLM_MAX_CONCURRENCY requests in flight per process: `with` from threads (sync and
+    streaming calls), `async with` on the llm loop. A freed slot goes to a waiting
+    coroutine first, else to a waiting thread."""
 
-PROMPTS = load_prompts()
+    def __init__(self, n: int):
+        self._cond = threading.Condition()
+        self._free = n
+        self._afuts: "collections.deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]" = collections.deque()
+
+    def __enter__(self):
+        with self._cond:
+            while self._free <= 0:
+                self._cond.wait()
+            self._free -= 1
+
+    def __exit__(self, *exc):
+        self.release()
+
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self._free > 0:
+                self._free -= 1
+                return
+            fut = loop.create_future()
+            self._afuts.append((loop, fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            with self._cond:
+                if (loop, fut) in self._afuts:
+                    self._afuts.remove((loop, fut))
+                    raise
+            if fut.done() and not fut.cancelled():
+                self.release()  # granted just before the cancel
+            raise
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    def _grant(self, fut: asyncio.Future) -> None:
+        if fut.cancelled():
+            self.release()  # waiter cancelled before the handover: pass the slot on
+        else:
+            fut.set_result(None)
+
+    def release(self) -> None:
+        with self._cond:
+            if self._afuts:
+                loop, fut = self._afuts.popleft()
+                loop.call_soon_threadsafe(self._grant, fut)
+                return
+            self._free += 1
+            self._cond.notify()
+
+_SLOTS = _Slots(LLM_MAX_CONCURRENCY)
+
+async def _on_llm_loop(coro: Awaitable[T]) -> T:
+    """Await `coro` on the llm loop, hopping over from a foreign loop if needed."""
+    loop = _llm_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        return await coro
+    # tasks on the llm loop don't inherit our context; carry the call record over
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(metrics.carry(coro, metrics.current()), loop))
+
+def run_sync(coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """Bridge for sync callers (e.g. Streamlit scripts): block on `coro` run on the llm loop."""
+    loop = _llm_loop()
+    if threading.current_thread() is _loop_thread:
+        raise RuntimeError("run_sync() cannot be called from the llm event loop")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
 
 # ---------------- Low-level Chat ----------------
-def _azure_chat(messages, temperature=0.3, timeout=60, max_retries=3, retry_backoff=1.5) -> str:
-    if not (AZURE_API_KEY and AZURE_ENDPOINT and AZURE_DEPLOYMENT):
-        raise RuntimeError(
-            "Azure OpenAI config missing. Set env vars or Streamlit secrets: "
-            "AZURE_OPENAI_KEY / AZURE_OPENAI_ENDPOINT / AZURE_OPENAI_DEPLOYMENT."
-        )
-    url = f"{AZURE_ENDPOINT}/openai/deployments/{AZURE_DEPLOYMENT}/chat/completions?api-version={AZURE_API_VERSION}"
-    headers = {"Content-Type": "application/json", "api-key": AZURE_API_KEY}
-    body = {
+_TRANSIENT_STATUS = (429, 500, 502, 503, 504)
+
+def _chat_body(messages, temperature) -> Dict:
+    return {
         "messages": messages,
         "temperature": temperature,
         "response_format": {"type": "json_object"},
     }
-    last_err = None
-    for attempt in range(max_retries):
+
+# ---------------- Usage accounting ----------------
+# Token usage (incl. provider prompt-cache hits) aggregated per process, so the
+# saving from the stable system-prompt prefix can be measured.
+_usage_lock = threading.Lock()
+_usage = {
+    "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0,
+    "cached_tokens": 0, "calls_with_cache_hit": 0, "calls_usage_unknown": 0,
+    "latency_s_cache_hit": 0.0, "latency_s_cache_miss": 0.0,
+}
+_last_usage: Dict = {}
+
+def _record_usage(data: Dict, latency: float) -> Optional[Dict]:
+    """Account one reply's usage block; None (counted as unknown) when it has none."""
+    global _last_usage
+    u = data.get("usage")
+    if not u:
+        with _usage_lock:
+            _usage["calls_usage_unknown"] += 1
+        return None
+    cached = int(((u.get("prompt_tokens_details") or {}).get("cached_tokens")) or 0)
+    rec = {
+        "prompt_tokens": int(u.get("prompt_tokens") or 0),
+        "completion_tokens": int(u.get("completion_tokens") or 0),
+        "total_tokens": int(u.get("total_tokens") or 0),
+        "cached_tokens": cached,
+        "latency_s": latency,
+    }
+    with _usage_lock:
+        _usage["calls"] += 1
+        for k in ("prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens"):
+            _usage[k] += rec[k]
+        if cached:
+            _usage["calls_with_cache_hit"] += 1
+            _usage["latency_s_cache_hit"] += latency
+        else:
+            _usage["latency_s_cache_miss"] += latency
+        _last_usage = rec
+    return rec
+
+def usage_stats() -> Dict:
+    """Token totals and cache-hit ratios over the calls that reported usage. Streamed
+    replies only do when stream_options is sent (AZURE_STREAM_USAGE); the rest are
+    counted in calls_usage_unknown and left out of every other figure."""
+    with _usage_lock:
+        out = dict(_usage, last=dict(_last_usage))
+    hits, calls = out["calls_with_cache_hit"], out["calls"]
+    out["cached_token_ratio"] = out["cached_tokens"] / out["prompt_tokens"] if out["prompt_tokens"] else 0.0
+    out["avg_latency_s_cache_hit"] = out["latency_s_cache_hit"] / hits if hits else 0.0
+    out["avg_latency_s_cache_miss"] = out["latency_s_cache_miss"] / (calls - hits) if calls - hits else 0.0
+    return out
+
+# ---------------- Deployments & throttling ----------------
+def _load_deployments():
+    entries = AZURE_DEPLOYMENTS
+    if isinstance(entries, str):
+        entries = json.loads(entries)
+    defaults = {
+        "endpoint": AZURE_ENDPOINT, "deployment": AZURE_DEPLOYMENT,
+        "api_key": AZURE_API_KEY, "api_version": AZURE_API_VERSION,
+        "rpm": AZURE_RPM, "tpm": AZURE_TPM,
+        "failure_threshold": CIRCUIT_FAILURE_THRESHOLD, "reset_timeout": CIRCUIT_RESET_TIMEOUT,
+    }
+    limiter = None
+    if SHARED_STORE is not None:
+        limiter = lambda name, rpm, tpm: ratelimit.SharedRateLimiter(SHARED_STORE, f"ratelimit:{name}", rpm=rpm, tpm=tpm)
+    return deployments.from_config(entries or [{"name": "default"}], defaults, limiter=limiter)
+
+ROUTER = deployments.Router(_load_deployments())
+
+def deployment_stats() -> Dict:
+    """Per-deployment outstanding/calls/errors/latency plus limiter and breaker state."""
+    return ROUTER.stats()
+
+def _check_config() -> None:
+    if not any(d.configured for d in ROUTER.deployments):
+        raise RuntimeError(
+            "Azure OpenAI config missing. Set env vars or Streamlit secrets: "
+            "AZURE_API_KEY / AZURE_ENDPOINT / AZURE_DEPLOYMENT (or AZURE_DEPLOYMENTS)."
+        )
+
+def _prompt_tokens(messages) -> int:
+    # ~4 chars/token is close enough for reserving TPM budget
+    return sum(len(m.get("content") or "") for m in messages) // 4
+
+def _estimate_tokens(messages) -> int:
+    return _prompt_tokens(messages) + AZURE_MAX_COMPLETION_TOKENS_EST
+
+class _Attempt:
+    """Bookkeeping for one request to one deployment: limiter, breaker, stats."""
+
+    def __init__(self, dep: deployments.Deployment, est_tokens: int):
+        self.dep = dep
+        self.est = est_tokens
+        self.t0 = 0.0
+        self.status: Optional[int] = None
+        self.ok = False
+        self.retry_after: Optional[float] = None
+        self.err: Optional[str] = None
+        self.settled = False  # the breaker has been told how this attempt went
+
+    def start(self) -> None:
+        self.t0 = time.perf_counter()
+
+    def transient(self, resp) -> RuntimeError:
+        self.status = resp.status_code
+        self.retry_after = ratelimit.parse_retry_after(resp.headers)
+        if self.status == 429:
+            self.dep.limiter.on_throttle(self.retry_after)
+        self.dep.breaker.record_failure()
+        self.settled = True
+        self.err = f"transient {self.status}"
+        return RuntimeError(f"AOAI transient {self.status} from {self.dep.name}: {resp.text[:300]}")
+
+    def success(self, resp, data: Dict) -> str:
+        self.status = resp.status_code
+        return self.completed(data["choices"][0]["message"]["content"].strip(), data)
+
+    def completed(self, content: str, data: Dict) -> str:
+        """Account a finished completion; `data` only needs its `usage` block."""
+        latency = time.perf_counter() - self.t0
+        rec = _record_usage(data, latency)
+        self.dep.limiter.on_success()
+        if rec is not None:  # else the limiter keeps the estimate
+            self.dep.limiter.settle(self.est, rec["total_tokens"] or rec["prompt_tokens"] + rec["completion_tokens"])
+            metrics.note(prompt_tokens=rec["prompt_tokens"], completion_tokens=rec["completion_tokens"],
+                         cached_tokens=rec["cached_tokens"])
+        self.dep.breaker.record_success()
+        self.settled = True
+        self.ok = True
+        return content
+
+    def error(self, e: Exception) -> None:
+        self.err = f"{type(e).__name__}: {e}"[:200]
+        if isinstance(e, (requests.HTTPError, httpx.HTTPStatusError)):
+            self.dep.breaker.record_success()  # upstream answered; the request itself was rejected
+        else:
+            self.dep.breaker.record_failure()
+        self.settled = True
+
+    def finish(self) -> None:
+        if not self.settled:  # cancelled / GeneratorExit: no verdict, hand back a half-open trial
+            self.dep.breaker.release_trial()
+        latency = (time.perf_counter() - self.t0) if self.t0 else None
+        self.dep.end(latency=latency, status=self.status, error=not self.ok)
+        if latency is not None:
+            metrics.attempt(self.dep.name, self.status, latency, None if self.ok else self.err)
+
+def _client_error(e: BaseException) -> bool:
+    """A 4xx other than 429 (bad request, auth, context length): the same request fails again."""
+    resp = getattr(e, "response", None)
+    status = getattr(resp, "status_code", None)
+    return status is not None and 400 <= status < 500 and status not in _TRANSIENT_STATUS
+
+class _Retry:
+    """Retry / fail-over policy shared by the sync, async and streaming chat calls.
+
+    Callers loop `while True`: pick() an attempt, run it, and on failure sleep for
+    failed(), which raises once retries are used up and otherwise returns the
+    backoff (0 when another healthy deployment can take the retry).
+    """
+
+    def __init__(self, messages, max_retries: int, retry_backoff: float, est_tokens: Optional[int] = None):
+        _check_config()
+        self.est = est_tokens or _estimate_tokens(messages)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.tried: list = []
+
+    def pick(self) -> _Attempt:
+        return _Attempt(ROUTER.pick(exclude=self.tried), self.est)
+
+    def failed(self, a: _Attempt, err: BaseException) -> float:
+        self.tried.append(a.dep)
+        n = len(self.tried)
+        if n >= self.max_retries or _client_error(err):
+            raise err
+        if ROUTER.has_alternative(self.tried):
+            return 0.0
+        delay = ratelimit.backoff_delay(n - 1, self.retry_backoff, retry_after=a.retry_after)
+        metrics.add_phase("backoff", delay)
+        return delay
+
+def _azure_chat(messages, temperature=0.3, timeout=60, max_retries=3, retry_backoff=1.5,
+                est_tokens: Optional[int] = None) -> str:
+    body = _chat_body(messages, temperature)
+    retry = _Retry(messages, max_retries, retry_backoff, est_tokens)
+    while True:
+        a = retry.pick()
         try:
-            resp = requests.post(url, headers=headers, json=body, timeout=timeout)
-            if resp.status_code in (429, 500, 502, 503, 504):
-                last_err = RuntimeError(f"AOAI transient {resp.status_code}: {resp.text[:300]}")
-                time.sleep(retry_backoff ** attempt)
-                continue
-            resp.raise_for_status()
-            return resp.json()["choices"][0]["message"]["content"].strip()
+            tq = time.perf_counter()
+            time.sleep(a.dep.limiter.reserve(a.est))
+            with _SLOTS:
+                metrics.add_phase("queue", time.perf_counter() - tq)
+                a.start()
+                resp = _http().post(a.dep.url, headers=a.dep.headers, json=body, timeout=timeout)
+            if resp.status_code in _TRANSIENT_STATUS:
+                err = a.transient(resp)
+            else:
+                resp.raise_for_status()
+                return a.success(resp, resp.json())
         except Exception as e:
-            last_err = e
-            time.sleep(retry_backoff ** attempt)
-    raise last_err
+            err = e
+            a.error(e)
+        finally:
+            a.finish()
+        time.sleep(retry.failed(a, err))
+
+async def _azure_chat_async(messages, temperature=0.3, timeout=60, max_retries=3, retry_backoff=1.5,
+                            est_tokens: Optional[int] = None) -> str:
+    """Async twin of _azure_chat. Holds a concurrency slot only while the request is in flight."""
+    body = _chat_body(messages, temperature)
+    retry = _Retry(messages, max_retries, retry_backoff, est_tokens)
+    while True:
+        a = retry.pick()
+        try:
+            tq = time.perf_counter()
+            await asyncio.sleep(a.dep.limiter.reserve(a.est))
+            async with _SLOTS:
+                metrics.add_phase("queue", time.perf_counter() - tq)
+                a.start()
+                resp = await _async_http().post(a.dep.url, headers=a.dep.headers, json=body, timeout=timeout)
+            if resp.status_code in _TRANSIENT_STATUS:
+                err = a.transient(resp)
+            else:
+                resp.raise_for_status()
+                return a.success(resp, resp.json())
+        except Exception as e:
+            err = e
+            a.error(e)
+        finally:
+            a.finish()
+        await asyncio.sleep(retry.failed(a, err))
+
+def _stream_usage(dep) -> bool:
+    if AZURE_STREAM_USAGE is None:
+        return dep.api_version[:10] >= "2024-09-01"
+    return str(AZURE_STREAM_USAGE).strip().lower() in ("1", "true", "yes", "on")
+
+def _sse_events(lines) -> Iterator[Dict]:
+    """Decode `data: {...}` chat-completion chunks until `data: [DONE]`."""
+    for line in lines:
+        if not line or not line.startswith("data:"):
+            continue
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            return
+        yield json.loads(payload)
+
+def _azure_chat_stream(messages, temperature=0.3, timeout=60, max_retries=3, retry_backoff=1.5) -> Iterator[str]:
+    """Yield content deltas from a streamed completion.
+
+    Retries/fail-over only happen before the first chunk; a stream that breaks
+    midway raises, since the caller has already shown partial output.
+    """
+    body = dict(_chat_body(messages, temperature), stream=True)
+    retry = _Retry(messages, max_retries, retry_backoff)
+    while True:
+        a = retry.pick()
+        try:
+            if _stream_usage(a.dep):
+                body["stream_options"] = {"include_usage": True}
+            else:
+                body.pop("stream_options", None)
+            tq = time.perf_counter()
+            time.sleep(a.dep.limiter.reserve(a.est))
+            with _SLOTS:
+                metrics.add_phase("queue", time.perf_counter() - tq)
+                a.start()
+                with _http().post(a.dep.url, headers=a.dep.headers, json=body, timeout=timeout, stream=True) as resp:
+                    if resp.status_code in _TRANSIENT_STATUS:
+                        err = a.transient(resp)
+                    else:
+                        resp.raise_for_status()
+                        a.status = resp.status_code
+                        parts, usage = [], {}
+                        for chunk in _sse_events(resp.iter_lines(decode_unicode=True)):
+                            usage = chunk.get("usage") or usage
+                            for choice in chunk.get("choices") or ():
+                                delta = (choice.get("delta") or {}).get("content")
+                                if delta:
+                                    parts.append(delta)
+                                    yield delta
+                        a.completed("".join(parts), {"usage": usage})
+                        return
+        except Exception as e:
+            err = e
+            a.error(e)
+            if a.status is not None and not a.ok and a.status < 400:
+                raise  # broke mid-stream
+        finally:
+            a.finish()
+        time.sleep(retry.failed(a, err))
 
 # ---------------- JSON helpers ----------------
-def _strip_code_fences(s: str) -> str:
-    return re.sub(r"^```(?:json)?\s*|\s*```$", "", s.strip(), flags=re.I | re.M)
-
-def _json_only(s: str) -> dict:
-    s = _strip_code_fences(s)
-    m = re.search(r"\{.*\}", s, flags=re.S)
-    if m:
-        s = m.group(0)
-    return json.loads(s)
-
-# ---------------- Prompt inject ----------------
-def _inject_vars_once(text: str) -> str:
-    if not isinstance(text, str):
-        return text
-    common_desc = PROMPTS.get("common_desc", "")
-    feedback_style = PROMPTS.get("feedback_style", "")
-    evidence_common = PROMPTS.get("components", {}).get("evidence_common", "")
-    reasoning_common = PROMPTS.get("components", {}).get("reasoning_common", "")
-    return (text
-            .replace("{{common_desc}}", common_desc)
-            .replace("{{feedback_style}}", feedback_style)
-            .replace("{{evidence_common}}", evidence_common)
-            .replace("{{reasoning_common}}", reasoning_common))
-
-def _inject_vars(text: str, passes: int = 3) -> str:
-    if not isinstance(text, str):
-        return text
-    out = text
-    for _ in range(passes):
-        new_out = _inject_vars_once(out)
-        if new_out == out:
+_PARTIAL_LABEL = re.compile(r'"label"\s*:\s*"([^"\\]*)"')
+_PARTIAL_FEEDBACK = re.compile(r'"step_feedback"\s*:\s*"')
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+def _hex4(h: str) -> Optional[int]:
+    try:
+        return int(h, 16) if len(h) == 4 else None
+    except ValueError:
+        return None
+
+def _partial_string(s: str, i: int) -> str:
+    """Decode a JSON string body starting at s[i] up to its closing quote or the end of s."""
+    out = []
+    n = len(s)
+    while i < n:
+        c = s[i]
+        if c == '"':
             break
-        out = new_out
-    return out
+        if c != "\\":
+            out.append(c)
+            i += 1
+            continue
+        if i + 1 >= n:
+            break  # escape not complete yet
+        e = s[i + 1]
+        if e == "u":
+            if i + 6 > n:
+                break
+            code = _hex4(s[i + 2:i + 6])
+            if code is not None and 0xD800 <= code < 0xDC00:  # high surrogate: pair it with the next escape
+                rest = s[i + 6:i + 12]
+                if len(rest) < 6 and "\\u".startswith(rest[:2]):
+                    break  # low half not streamed yet
+                low = _hex4(rest[2:]) if rest[:2] == "\\u" else None
+                if low is not None and 0xDC00 <= low < 0xE000:
+                    out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                    i += 12
+                    continue
+                code = 0xFFFD
+            elif code is not None and 0xDC00 <= code < 0xE000:
+                code = 0xFFFD  # lone low surrogate
+            if code is not None:
+                out.append(chr(code))
+            i += 6
+            continue
+        out.append(_ESCAPES.get(e, e))
+        i += 2
+    return "".join(out)
+
+def _partial_fields(buf: str) -> Tuple[Optional[str], str]:
+    """(label, step_feedback so far) from an incomplete JSON object."""
+    m = _PARTIAL_LABEL.search(buf)
+    label = m.group(1).strip().lower() if m else None
+    m = _PARTIAL_FEEDBACK.search(buf)
+    feedback = _partial_string(buf, m.end()) if m else ""
+    return label, feedback
 
+# ---------------- Prompt lookup ----------------
 def _get_prompt_component(name: str, claim_side: Optional[str] = None) -> str:
     """name ∈ {'evidence','reasoning'}"""
-    comp = PROMPTS.get("components", {}).get(name, {})
-    if isinstance(comp, dict):
-        if claim_side and claim_side in comp:
-            return _inject_vars(comp[claim_side])
-        if "system" in comp:
-            return _inject_vars(comp["system"])
-    top = PROMPTS.get(name)
-    if isinstance(top, str):
-        return _inject_vars(top)
-    raise KeyError(f"Prompt not found for component={name}, claim_side={claim_side}")
+    return llm_prompts.lookup(prompt_set().compiled, name, claim_side).system
 
 # ---------------- Public API ----------------
-def _ask_component(prompt_system: str, user_content: str, temperature=0.3) -> Dict:
-    content = _azure_chat(
-        messages=[{"role": "system", "content": prompt_system},
-                  {"role": "user", "content": user_content}],
-        temperature=temperature
-    )
-    obj = _json_only(content)
-    obj["label"] = str(obj.get("label", "")).strip().lower()
-    obj["step_feedback"] = str(obj.get("step_feedback", "")).strip()
+def _parse_component(content: str, labels=None) -> Dict:
+    """Tolerant parse (see llm_json); raises llm_json.UnrecoverableOutput."""
     try:
-        obj["confidence"] = float(obj.get("confidence", 0))
-    except Exception:
-        obj["confidence"] = 0.0
+        with metrics.phase("parse"):
+            obj, repairs = llm_json.parse(content, labels)
+    except ValueError:
+        metrics.note(parse_error=True)
+        raise
+    if repairs:
+        metrics.note(json_repairs=list(repairs))
     return obj
 
-def step_feedback(component: str, claim_side: Optional[str], student_text: str, evidence_text: str = "") -> Dict:
-    sys_prompt = _get_prompt_component(component, claim_side)
-    user_tpl = PROMPTS.get("user_templates", {}).get(component, "{text}")
+def _reask_messages(messages, content: str, labels) -> list:
+    """Targeted follow-up after an unreadable reply: same conversation plus a format reminder."""
+    choices = "|".join(sorted(labels)) if labels else "..."
+    return list(messages) + [
+        {"role": "assistant", "content": content[:2000]},
+        {"role": "user", "content": ("Your reply could not be read. Answer again with ONLY one JSON object: "
+                                     f'{{"label":"{choices}","step_feedback":"...","confidence":0-1}}')},
+    ]
+
+SystemPrompt = Union[str, Sequence[str]]
+
+def _messages(prompt_system: SystemPrompt, user_content: str):
+    """Static system parts first (byte-identical across calls), student content last."""
+    parts = (prompt_system,) if isinstance(prompt_system, str) else tuple(prompt_system)
+    return ([{"role": "system", "content": p} for p in parts]
+            + [{"role": "user", "content": user_content}])
+
+def _ask_component_once(prompt_system: SystemPrompt, user_content: str, temperature=0.3, labels=None) -> Dict:
+    messages = _messages(prompt_system, user_content)
+    content = _azure_chat(messages=messages, temperature=temperature)
+    try:
+        return _parse_component(content, labels)
+    except llm_json.UnrecoverableOutput:
+        if not LLM_JSON_REASK:
+            raise
+    metrics.note(reask=True)
+    content = _azure_chat(messages=_reask_messages(messages, content, labels), temperature=temperature)
+    return _parse_component(content, labels)
+
+async def _aask_component_once(prompt_system: SystemPrompt, user_content: str, temperature=0.3, labels=None) -> Dict:
+    messages = _messages(prompt_system, user_content)
+    content = await _azure_chat_async(messages=messages, temperature=temperature)
+    try:
+        return _parse_component(content, labels)
+    except llm_json.UnrecoverableOutput:
+        if not LLM_JSON_REASK:
+            raise
+    metrics.note(reask=True)
+    content = await _azure_chat_async(messages=_reask_messages(messages, content, labels), temperature=temperature)
+    return _parse_component(content, labels)
+
+# ---------------- Single-flight ----------------
+# Identical (system, user, temperature) requests that overlap in time share one
+# upstream call. Sync callers coalesce through threading events; async callers
+# (all Streamlit sessions, via run_sync) through futures on the llm loop.
+class _Flight:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Optional[Dict] = None
+        self.error: Optional[BaseException] = None
+
+    def close(self) -> None:
+        self.event.set()
+
+class _StreamFlight(_Flight):
+    """A streaming leader's flight: followers replay its partial updates as they arrive."""
+    __slots__ = ("cond", "updates")
+
+    def __init__(self):
+        super().__init__()
+        self.cond = threading.Condition()
+        self.updates: list = []
+
+    def push(self, update: Dict) -> None:
+        with self.cond:
+            self.updates.append(update)
+            self.cond.notify_all()
+
+    def close(self) -> None:
+        with self.cond:
+            self.event.set()
+            self.cond.notify_all()
+
+    def follow(self) -> Iterator[Dict]:
+        """Partial updates so far, then each new one, until the leader finishes."""
+        i = 0
+        while True:
+            with self.cond:
+                while i == len(self.updates) and not self.event.is_set():
+                    self.cond.wait()
+                new, i = self.updates[i:], len(self.updates)
+                done = self.event.is_set()
+            for update in new:
+                yield dict(update)
+            if done:
+                return
+
+class _LeaderGone(Exception):
+    """The streaming leader's consumer went away mid-call; a follower takes over."""
+
+class _AFlight:
+    """An async flight: the upstream call runs in its own task, shared by every caller
+    awaiting it, and is cancelled only when all of them have been (a cancelled leader
+    such as a discarded speculation leaves its followers' call running)."""
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+_flights: Dict[str, _Flight] = {}
+_aflights: Dict[str, _AFlight] = {}
+_flights_lock = threading.Lock()
+_flight_counts = {"leaders": 0, "coalesced": 0}
+
+def _flight_key(prompt_system: SystemPrompt, user_content: str, temperature) -> str:
+    parts = (prompt_system,) if isinstance(prompt_system, str) else tuple(prompt_system)
+    h = hashlib.sha256()
+    for part in parts + (user_content, repr(float(temperature))):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def coalesce_stats() -> Dict:
+    with _flights_lock:
+        return dict(_flight_counts, in_flight=len(_flights) + len(_aflights))
+
+def _join_flight(key: str, cls=_Flight) -> Tuple[_Flight, bool]:
+    """(new flight, True) if the caller leads `key`, else (the one in flight, False)."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is None:
+            flight = _flights[key] = cls()
+            _flight_counts["leaders"] += 1
+            return flight, True
+        _flight_counts["coalesced"] += 1
+        return flight, False
+
+def _land(key: str, flight: _Flight) -> None:
+    with _flights_lock:
+        _flights.pop(key, None)
+    flight.close()
+
+def _ask_component(prompt_system: SystemPrompt, user_content: str, temperature=0.3, labels=None) -> Dict:
+    key = _flight_key(prompt_system, user_content, temperature)
+    while True:
+        flight, leader = _join_flight(key)
+        if leader:
+            break
+        metrics.note(outcome="coalesced")
+        flight.event.wait()
+        if isinstance(flight.error, _LeaderGone):
+            continue
+        if flight.error is not None:
+            raise flight.error
+        return dict(flight.result)
+    try:
+        flight.result = _ask_component_once(prompt_system, user_content, temperature=temperature, labels=labels)
+        return dict(flight.result)
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        _land(key, flight)
+
+async def _aask_component(prompt_system: SystemPrompt, user_content: str, temperature=0.3, labels=None) -> Dict:
+    """Must run on the llm loop (see astep_feedback)."""
+    key = _flight_key(prompt_system, user_content, temperature)
+    flight = _aflights.get(key)
+    if flight is None:
+        flight = _aflights[key] = _AFlight(asyncio.get_running_loop().create_task(
+            _aask_component_once(prompt_system, user_content, temperature=temperature, labels=labels)))
+        flight.task.add_done_callback(lambda _: _aflights.pop(key, None) if _aflights.get(key) is flight else None)
+        with _flights_lock:
+            _flight_counts["leaders"] += 1
+    else:
+        metrics.note(outcome="coalesced")
+        with _flights_lock:
+            _flight_counts["coalesced"] += 1
+    flight.waiters += 1
+    try:
+        return dict(await asyncio.shield(flight.task))
+    finally:
+        flight.waiters -= 1
+        if not flight.waiters and not flight.task.done():  # every caller cancelled: stop the upstream call
+            if _aflights.get(key) is flight:
+                del _aflights[key]
+            flight.task.cancel()
+
+# ---------------- Pre-screening ----------------
+PRESCREEN = prescreen.Prescreener(
+    prescreen.table_numbers(prompt_set().conf.get("common_desc", ""), dataset.TABLE),
+    min_chars=PRESCREEN_MIN_CHARS,
+    min_words=PRESCREEN_MIN_WORDS,
+    require_numbers=PRESCREEN_REQUIRE_NUMBERS,
+    shadow_rate=PRESCREEN_SHADOW_RATE,
+) if PRESCREEN_ENABLED else None
+
+async def _shadow_check(ps, screened: Dict, component, claim_side, student_text, evidence_text, temperature) -> None:
+    try:
+        sys_prompt, user_payload = _build_step(ps, component, claim_side, student_text, evidence_text)
+        res = await _aask_component(sys_prompt, user_payload, temperature=temperature, labels=_LABELS.get(component))
+        PRESCREEN.record_shadow(screened, res.get("label"))
+    except Exception:
+        PRESCREEN.record_shadow(screened, None)
+
+def _prescreen(ps, component, claim_side, student_text, evidence_text, temperature) -> Optional[Dict]:
+    """Templated failing result for submissions that need no model call, else None."""
+    if PRESCREEN is None:
+        return None
+    out = PRESCREEN.screen(component, student_text)
+    if out is not None and PRESCREEN.want_shadow():
+        # fire and forget on the llm loop; the student already has their answer
+        asyncio.run_coroutine_threadsafe(
+            _shadow_check(ps, out, component, claim_side, student_text, evidence_text, temperature), _llm_loop())
+    return out
+
+def prescreen_stats() -> Dict:
+    return PRESCREEN.stats() if PRESCREEN is not None else {}
+
+def _build_step(ps, component: str, claim_side: Optional[str], student_text: str, evidence_text: str = ""):
+    compiled = llm_prompts.lookup(ps.compiled, component, claim_side)
+    sys_prompt, user_tpl = compiled.system_parts(), compiled.user_template
 
     if component == "reasoning":
         user_payload = user_tpl.format(
@@ -133,7 +1011,392 @@ def step_feedback(component: str, claim_side: Optional[str], student_text: str,
             text=(student_text or "").strip(),
             claim_side=claim_side or "",
         )
-    return _ask_component(sys_prompt, user_payload)
+    return sys_prompt, user_payload
+
+def step_feedback(component: str, claim_side: Optional[str], student_text: str, evidence_text: str = "",
+                  temperature: float = 0.3, prompt_version: Optional[str] = None) -> Dict:
+    ps = prompt_set(prompt_version)
+    with metrics.call(component, claim_side):
+        screened = _prescreen(ps, component, claim_side, student_text, evidence_text, temperature)
+        if screened is not None:
+            return _observed(ps, screened, "prescreened")
+        key = _cache_key(ps, component, claim_side, student_text, evidence_text, temperature)
+        lease = None
+        with metrics.phase("cache"):
+            hit = _cache_get(key)
+            if hit is None:
+                hit, lease = _await_peer(key)
+        if hit is not None:
+            return _observed(ps, hit, "cached")
+        try:
+            with metrics.phase("prompt_build"):
+                sys_prompt, user_payload = _build_step(ps, component, claim_side, student_text, evidence_text)
+            out = _ask_component(sys_prompt, user_payload, temperature=temperature, labels=_LABELS.get(component))
+            _cache_put(ps, key, component, out)
+        finally:
+            _cache_release(lease)
+        return _observed(ps, out)
+
+async def astep_feedback(component: str, claim_side: Optional[str], student_text: str, evidence_text: str = "",
+                         temperature: float = 0.3, prompt_version: Optional[str] = None) -> Dict:
+    """Asyncio-native step_feedback; runs on the shared llm loop and client."""
+    ps = prompt_set(prompt_version)
+    with metrics.call(component, claim_side):
+        screened = _prescreen(ps, component, claim_side, student_text, evidence_text, temperature)
+        if screened is not None:
+            return _observed(ps, screened, "prescreened")
+        key = _cache_key(ps, component, claim_side, student_text, evidence_text, temperature)
+        lease = None
+        with metrics.phase("cache"):
+            hit = _cache_get(key)
+            if hit is None and SHARED_STORE is not None:
+                hit, lease = await asyncio.to_thread(_await_peer, key)
+        if hit is not None:
+            return _observed(ps, hit, "cached")
+        try:
+            with metrics.phase("prompt_build"):
+                sys_prompt, user_payload = _build_step(ps, component, claim_side, student_text, evidence_text)
+            out = await _on_llm_loop(_aask_component(sys_prompt, user_payload, temperature=temperature,
+                                                     labels=_LABELS.get(component)))
+            _cache_put(ps, key, component, out)
+        finally:
+            _cache_release(lease)
+        return _observed(ps, out)
+
+def stream_step_feedback(component: str, claim_side: Optional[str], student_text: str, evidence_text: str = "",
+                         temperature: float = 0.3, prompt_version: Optional[str] = None) -> Iterator[Dict]:
+    """Streaming step_feedback for the UI.
+
+    Yields {"label", "step_feedback", "done": False} as the JSON arrives (label may
+    be None until seen), then the full validated result with "done": True.
+    Identical concurrent calls share one upstream stream (followers replay the
+    leader's partials), and a shared-cache lease holds off other replicas.
+    Unreadable output or an unknown label gets one non-streaming re-ask
+    (LLM_JSON_REASK); if that fails too, llm_json.UnrecoverableOutput is raised.
+    """
+    t_call = time.perf_counter()
+    ps = prompt_set(prompt_version)
+    with metrics.call(component, claim_side, stream=True):
+        hit = _prescreen(ps, component, claim_side, student_text, evidence_text, temperature)
+        if hit is not None:
+            _observed(ps, hit, "prescreened")
+        else:
+            key = _cache_key(ps, component, claim_side, student_text, evidence_text, temperature)
+            with metrics.phase("cache"):
+                hit = _cache_get(key)
+            if hit is not None:
+                _observed(ps, hit, "cached")
+        if hit is None:
+            with metrics.phase("prompt_build"):
+                sys_prompt, user_payload = _build_step(ps, component, claim_side, student_text, evidence_text)
+            fkey = _flight_key(sys_prompt, user_payload, temperature)
+        while hit is None:
+            # identical submissions in other sessions share one upstream stream
+            flight, leader = _join_flight(fkey, _StreamFlight)
+            if leader:
+                try:
+                    flight.result = hit = yield from _lead_stream(ps, key, component, sys_prompt, user_payload,
+                                                                   temperature, t_call, flight)
+                except GeneratorExit:
+                    flight.error = _LeaderGone()
+                    raise
+                except BaseException as e:
+                    flight.error = e
+                    raise
+                finally:
+                    _land(fkey, flight)
+            else:
+                metrics.note(outcome="coalesced")
+                if isinstance(flight, _StreamFlight):
+                    yield from flight.follow()
+                flight.event.wait()
+                if isinstance(flight.error, _LeaderGone):
+                    continue  # that student left mid-stream; take over
+                if flight.error is not None:
+                    raise flight.error
+                hit = _observed(ps, dict(flight.result))
+    yield dict(hit, done=True)
+
+def _lead_stream(ps, key, component, sys_prompt, user_payload, temperature, t_call, flight) -> Iterator[Dict]:
+    """Stream one upstream call, publishing each partial to `flight`; returns the validated result.
+
+    Another replica already grading the same answer (shared lease) is waited for instead.
+    """
+    with metrics.phase("cache"):
+        hit, lease = _await_peer(key)
+    if hit is not None:
+        return _observed(ps, hit, "cached")
+    try:
+        buf, shown = "", ("", None)
+        for delta in _azure_chat_stream(_messages(sys_prompt, user_payload), temperature=temperature):
+            if not buf:
+                metrics.note(first_chunk_s=time.perf_counter() - t_call)
+            buf += delta
+            label, feedback = _partial_fields(buf)
+            if (feedback, label) != shown and (feedback or label):
+                shown = (feedback, label)
+                update = {"label": label, "step_feedback": feedback, "done": False}
+                flight.push(update)
+                yield dict(update)
+        labels = _LABELS.get(component)
+        try:
+            hit = _parse_component(buf, labels)
+        except llm_json.UnrecoverableOutput:
+            if not LLM_JSON_REASK:
+                raise
+            metrics.note(reask=True)
+            buf = _azure_chat(_reask_messages(_messages(sys_prompt, user_payload), buf, labels),
+                              temperature=temperature)
+            hit = _parse_component(buf, labels)
+        _cache_put(ps, key, component, hit)
+        return _observed(ps, hit)
+    finally:
+        _cache_release(lease)
+
+# ---------------- Batched grading ----------------
+# Offline regrades pack several submissions for one (component, claim_side) into a
+# single request, so the system prompt is sent once per group instead of once per
+# student. The model answers {"results": [{"index", "label", "step_feedback",
+# "confidence"}, ...]} (json_object mode needs an object around the array). A
+# group that overflows the context or comes back cut off / unreadable is split in
+# half; items still without a valid entry get a normal single call.
+_BATCH_INSTRUCTIONS = (
+    "You will receive several independent student submissions, each inside "
+    "<submission index=N> ... </submission>. Grade every submission on its own, exactly as "
+    "instructed above. Reply with ONLY one JSON object: "
+    '{"results": [{"index": N, "label": "...", "step_feedback": "...", "confidence": 0-1}, ...]} '
+    "with one entry per submission, in index order."
+)
+_batch_lock = threading.Lock()
+_batch_counts = {"items": 0, "requests": 0, "batched": 0, "fallbacks": 0, "splits": 0,
+                 "prompt_tokens_est": 0, "single_prompt_tokens_est": 0}
+
+def _batch_note(**counts) -> None:
+    with _batch_lock:
+        for k, v in counts.items():
+            _batch_counts[k] += v
+
+def batch_stats() -> Dict:
+    """Packed vs per-item prompt tokens (estimated) for everything sent via step_feedback_batch."""
+    with _batch_lock:
+        out = dict(_batch_counts)
+    single = out["single_prompt_tokens_est"]
+    out["prompt_tokens_saved_est"] = single - out["prompt_tokens_est"]
+    out["saved_ratio"] = out["prompt_tokens_saved_est"] / single if single else 0.0
+    return out
+
+def _batch_messages(sys_prompt: SystemPrompt, items) -> list:
+    parts = (sys_prompt,) if isinstance(sys_prompt, str) else tuple(sys_prompt)
+    body = "\n\n".join(f"<submission index={i}>\n{payload}\n</submission>" for i, payload in items)
+    return _messages(parts + (_BATCH_INSTRUCTIONS,), body)
+
+def _pack(sys_prompt: SystemPrompt, items) -> list:
+    """Greedy groups of at most LLM_BATCH_MAX_ITEMS that fit LLM_BATCH_MAX_TOKENS."""
+    base = _prompt_tokens(_batch_messages(sys_prompt, []))
+    groups, cur, used = [], [], base
+    for item in items:
+        cost = (len(item[1]) + 40) // 4 + AZURE_MAX_COMPLETION_TOKENS_EST
+        if cur and (len(cur) >= LLM_BATCH_MAX_ITEMS or used + cost > LLM_BATCH_MAX_TOKENS):
+            groups.append(cur)
+            cur, used = [], base
+        cur.append(item)
+        used += cost
+    if cur:
+        groups.append(cur)
+    return groups
+
+def _context_overflow(e: Exception) -> bool:
+    resp = getattr(e, "response", None)
+    return resp is not None and resp.status_code == 400 and "context_length" in resp.text
+
+def _parse_batch(content: str, indices, labels) -> Tuple[Dict[int, Dict], bool]:
+    """({index: result} for valid entries, whether the reply was cut off)."""
+    obj, repairs = llm_json.extract(content)
+    entries = obj.get("results")
+    if not isinstance(entries, list):
+        raise llm_json.UnrecoverableOutput("no results array")
+    truncated = "truncated" in repairs
+    if truncated:
+        entries = entries[:-1]  # the last entry may hold half a sentence
+    out = {}
+    for e in entries:
+        if not isinstance(e, dict):
+            continue
+        try:
+            i = int(e.get("index"))
+            res = llm_json.coerce(e, labels)
+        except (TypeError, ValueError):
+            continue
+        if i in indices and i not in out:
+            res.pop("index", None)
+            out[i] = res
+    return out, truncated
+
+def _grade_group(component, claim_side, sys_prompt, group, temperature, labels) -> Tuple[Dict[int, Dict], bool]:
+    """One packed request: ({index: result}, whether the unanswered rest should be split)."""
+    msgs = _batch_messages(sys_prompt, group)
+    est = _prompt_tokens(msgs)
+    _batch_note(requests=1, prompt_tokens_est=est)
+    with metrics.call(component, claim_side, batch=len(group)):
+        try:
+            content = _azure_chat(msgs, temperature=temperature,
+                                  est_tokens=est + len(group) * AZURE_MAX_COMPLETION_TOKENS_EST)
+        except requests.HTTPError as e:
+            if not _context_overflow(e):
+                raise
+            metrics.note(outcome="split")
+            return {}, True
+        try:
+            with metrics.phase("parse"):
+                got, truncated = _parse_batch(content, {i for i, _ in group}, labels)
+        except llm_json.UnrecoverableOutput:
+            metrics.note(parse_error=True, outcome="split")
+            return {}, True
+        metrics.note(answered=len(got), json_repairs=["truncated"] if truncated else [])
+    _batch_note(batched=len(got))
+    return got, truncated
+
+def step_feedback_batch(component: str, claim_side: Optional[str], texts: Sequence[str],
+                        evidence_texts: Optional[Sequence[str]] = None, temperature: float = 0.3,
+                        prompt_version: Optional[str] = None, return_exceptions: bool = False) -> list:
+    """step_feedback for many submissions, packed into as few requests as fit (offline regrades).
+
+    Results come back in input order. Prescreened and cached items never reach the
+    model. With return_exceptions, an item that cannot be graded holds its
+    exception instead of failing the whole batch (like asyncio.gather).
+    """
+    ps = prompt_set(prompt_version)
+    labels = _LABELS.get(component)
+    evidence_texts = list(evidence_texts) if evidence_texts is not None else [""] * len(texts)
+    results: list = [None] * len(texts)
+    keys, single_est, pending = {}, {}, []
+    sys_prompt = None
+    for i, text in enumerate(texts):
+        out = _prescreen(ps, component, claim_side, text, evidence_texts[i], temperature)
+        if out is None:
+            keys[i] = _cache_key(ps, component, claim_side, text, evidence_texts[i], temperature)
+            out = _cache_get(keys[i])
+        if out is not None:
+            results[i] = _observed(ps, out)
+            continue
+        sys_prompt, payload = _build_step(ps, component, claim_side, text, evidence_texts[i])
+        single_est[i] = _prompt_tokens(_messages(sys_prompt, payload))
+        pending.append((i, payload))
+    _batch_note(items=len(pending), single_prompt_tokens_est=sum(single_est.values()))
+
+    fallback = []
+    groups = _pack(sys_prompt, pending)[::-1] if pending else []
+    while groups:
+        group = groups.pop()
+        try:
+            got, split = _grade_group(component, claim_side, sys_prompt, group, temperature, labels)
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            for i, _ in group:
+                results[i] = e
+            continue
+        for i, out in got.items():
+            _cache_put(ps, keys[i], component, out)
+            results[i] = _observed(ps, out)
+        rest = [item for item in group if item[0] not in got]
+        if split and len(rest) > 1:
+            _batch_note(splits=1)
+            half = len(rest) // 2
+            groups += [rest[half:], rest[:half]]
+        else:
+            fallback += rest
+
+    for i, payload in fallback:
+        _batch_note(fallbacks=1, prompt_tokens_est=single_est[i])
+        try:
+            with metrics.call(component, claim_side, batch_fallback=True):
+                out = _ask_component(sys_prompt, payload, temperature=temperature, labels=labels)
+                _cache_put(ps, keys[i], component, out)
+                results[i] = _observed(ps, out)
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results[i] = e
+    return results
+
+# ---------------- Speculative reasoning ----------------
+_spec_lock = threading.Lock()
+_spec_counts = {"launched": 0, "hits": 0, "wasted": 0, "failed": 0, "capped": 0}
+
+def _spec_count(name: str) -> None:
+    with _spec_lock:
+        _spec_counts[name] += 1
+
+def speculation_stats() -> Dict:
+    with _spec_lock:
+        out = dict(_spec_counts)
+    out["hit_rate"] = out["hits"] / out["launched"] if out["launched"] else 0.0
+    return out
+
+class ReasoningSpeculator:
+    """One per session. start() grades the drafted reasoning against the evidence
+    snapshot being submitted, in parallel with the evidence check; take() hands
+    the result over only if claim, evidence and reasoning are still the same, and
+    leaves it pending when it is not done within the timeout.
+    """
+
+    def __init__(self, max_waste: Optional[int] = None):
+        self.max_waste = SPECULATIVE_MAX_WASTE if max_waste is None else max_waste
+        self.wasted = 0
+        self._snap: Optional[Tuple[str, str, str]] = None
+        self._fut = None
+
+    @staticmethod
+    def _snapshot(claim_side, evidence_text, reasoning_text) -> Tuple[str, str, str]:
+        return (claim_side or "", llm_cache.normalize_text(evidence_text), llm_cache.normalize_text(reasoning_text))
+
+    def start(self, claim_side: Optional[str], evidence_text: str, reasoning_text: str,
+              temperature: float = 0.3, prompt_version: Optional[str] = None) -> bool:
+        snap = self._snapshot(claim_side, evidence_text, reasoning_text)
+        if self._fut is not None:
+            if snap == self._snap:
+                return True
+            self.discard()
+        if not snap[2]:
+            return False
+        if self.wasted >= self.max_waste:
+            _spec_count("capped")
+            return False
+        self._snap = snap
+        self._fut = asyncio.run_coroutine_threadsafe(
+            astep_feedback("reasoning", claim_side, reasoning_text, evidence_text=evidence_text,
+                           temperature=temperature, prompt_version=prompt_version), _llm_loop())
+        _spec_count("launched")
+        return True
+
+    def take(self, claim_side: Optional[str], evidence_text: str, reasoning_text: str,
+             timeout: Optional[float] = None) -> Optional[Dict]:
+        """The speculative result for exactly these texts, else None (stale ones are discarded,
+        unfinished ones stay pending for a later take())."""
+        if self._fut is None:
+            return None
+        if self._snapshot(claim_side, evidence_text, reasoning_text) != self._snap:
+            self.discard()
+            return None
+        if not concurrent.futures.wait([self._fut], timeout).done:
+            return None
+        fut, self._fut, self._snap = self._fut, None, None
+        try:
+            out = fut.result()
+        except Exception:
+            _spec_count("failed")  # caller falls back to the normal reasoning check
+            return None
+        _spec_count("hits")
+        return dict(out, speculative=True)
+
+    def discard(self) -> None:
+        if self._fut is None:
+            return
+        self._fut.cancel()
+        self._fut, self._snap = None, None
+        self.wasted += 1
+        _spec_count("wasted")
 
 if __name__ == "__main__":
     print("llm.py ready (pattern removed).")
@@ -0,0 +1,205 @@
+# llm_cache.py
+# Response cache for llm.step_feedback: in-memory LRU in front of a SQLite file, or
+# of a shared_store (SQLite/Redis) that every replica reads and writes.
+from __future__ import annotations
+import hashlib, json, os, sqlite3, threading, time, unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+
+def normalize_text(s: str) -> str:
+    """Whitespace/unicode-insensitive form of a student answer, used for keys."""
+    s = unicodedata.normalize("NFC", s or "")
+    return " ".join(s.split())
+
+def make_key(prompt_version: str, prompt_hash: str, component: str, claim_side: Optional[str],
+             student_text: str, evidence_text: str, temperature: float) -> str:
+    raw = json.dumps([prompt_version, prompt_hash, component, claim_side or "",
+                      normalize_text(student_text), normalize_text(evidence_text),
+                      round(float(temperature), 3)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+_STORE_PREFIX = "llm:"
+_LEASE_PREFIX = "llm-lease:"
+
+
+class ResponseCache:
+    """Thread-safe LRU + optional SQLite store with a TTL and size caps.
+
+    Every row also stores the hash of the prompt file that produced it; rows
+    from files that are no longer live are dropped on open and on retain(), so
+    editing the YAML invalidates the cache.
+
+    With a `store` (shared_store) it replaces the SQLite file: entries carry the
+    store's TTL and the first replica to answer a key wins, so every replica hands
+    out the same feedback for it. retain() does not purge there, since another
+    replica may still be serving the old prompt file; keys include the prompt
+    hash, so stale entries are simply never read again and expire.
+    """
+
+    def __init__(self, path: Optional[str], prompt_hash: Union[str, Iterable[str]], max_entries: int = 2048,
+                 disk_max_entries: int = 50000, ttl: float = 7 * 24 * 3600, store=None):
+        self.prompt_hashes = frozenset([prompt_hash] if isinstance(prompt_hash, str) else prompt_hash)
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        self.ttl = ttl
+        self._mem: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.peer_hits = 0  # answers waited for while another replica computed them
+        self._store = store
+        self._db = None
+        if path and store is None:
+            d = os.path.dirname(path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")  # replicas may point at the same file
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, prompt_hash TEXT NOT NULL,"
+                " created REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses(created)")
+            self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - ttl,))
+            self._drop_stale_prompts()
+            self._db.commit()
+
+    def _drop_stale_prompts(self) -> None:
+        live = sorted(self.prompt_hashes)
+        self._db.execute(f"DELETE FROM responses WHERE prompt_hash NOT IN ({','.join('?' * len(live))})", live)
+
+    def retain(self, prompt_hashes: Iterable[str]) -> None:
+        """The live prompt files changed (hot reload): forget rows from the others."""
+        with self._lock:
+            self.prompt_hashes = frozenset(prompt_hashes)
+            if self._db is not None:
+                self._drop_stale_prompts()
+                self._db.commit()
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                created, value = hit
+                if now - created <= self.ttl:
+                    self._mem.move_to_end(key)
+                    self.hits += 1
+                    return dict(value)
+                del self._mem[key]
+        if self._store is not None:
+            raw = self._store.get(_STORE_PREFIX + key)  # network/disk I/O outside the lock
+            with self._lock:
+                if raw is None:
+                    self.misses += 1
+                    return None
+                entry = json.loads(raw)
+                self._remember(key, entry["created"], entry["value"])
+                self.hits += 1
+                self.disk_hits += 1
+                return dict(entry["value"])
+        with self._lock:
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT created, value FROM responses WHERE key = ?", (key,),
+                ).fetchone()
+                if row is not None and now - row[0] <= self.ttl:
+                    value = json.loads(row[1])
+                    self._remember(key, row[0], value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return dict(value)
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: Dict, prompt_hash: Optional[str] = None) -> None:
+        """Keys must already include the prompt hash (see make_key); it is stored for purging."""
+        prompt_hash = prompt_hash or min(self.prompt_hashes)
+        now = time.time()
+        if self._store is not None:
+            entry = {"created": now, "value": value}
+            if not self._store.add(_STORE_PREFIX + key, json.dumps(entry, ensure_ascii=False), self.ttl):
+                raw = self._store.get(_STORE_PREFIX + key)  # lost the race: keep the winner's answer
+                entry = json.loads(raw) if raw else entry
+            with self._lock:
+                self._remember(key, entry["created"], dict(entry["value"]))
+            return
+        with self._lock:
+            self._remember(key, now, dict(value))
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses(key, prompt_hash, created, value) VALUES (?, ?, ?, ?)",
+                (key, prompt_hash, now, json.dumps(value, ensure_ascii=False)),
+            )
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._trim_disk(now)
+            self._db.commit()
+
+    def await_peer(self, key: str, lease: float) -> Tuple[Optional[Dict], bool]:
+        """After a miss on a shared store: wait while another replica holds the lease
+        on `key`. Returns (its answer, False), or (None, True) once this replica holds
+        the lease (it should call the model, then release()), or (None, False) when
+        the wait timed out or there is no store: call the model but release nothing."""
+        if self._store is None:
+            return None, False
+        deadline, delay = time.monotonic() + lease, 0.05
+        while not self._store.add(_LEASE_PREFIX + key, "1", lease):
+            if time.monotonic() >= deadline:
+                return None, False
+            time.sleep(delay)
+            delay = min(delay * 1.5, 0.5)
+            raw = self._store.get(_STORE_PREFIX + key)
+            if raw is not None:
+                entry = json.loads(raw)
+                with self._lock:
+                    self._remember(key, entry["created"], entry["value"])
+                    self.peer_hits += 1
+                return dict(entry["value"]), False
+        return None, True
+
+    def release(self, key: str) -> None:
+        if self._store is not None:
+            self._store.delete(_LEASE_PREFIX + key)
+
+    def _remember(self, key: str, created: float, value: Dict) -> None:
+        self._mem[key] = (created, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def _trim_disk(self, now: float) -> None:
+        self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM responses WHERE key IN ("
+            " SELECT key FROM responses ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.disk_max_entries,),
+        )
+
+    def clear(self) -> None:
+        if self._store is not None:
+            self._store.clear(_STORE_PREFIX)
+        with self._lock:
+            self._mem.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "peer_hits": self.peer_hits,
+                "hit_ratio": (self.hits / total) if total else 0.0,
+                "mem_entries": len(self._mem),
+                "shared": self._store is not None,
+            }
@@ -0,0 +1,191 @@
+# llm_json.py
+# Tolerant extraction of the grading JSON object from raw model output.
+#
+# Fast path: json's raw_decode on the first "{" (handles fences and surrounding
+# prose for free). Only if that fails is the text rewritten in one pass: smart or
+# single quotes, trailing commas, raw newlines in strings, Python literals,
+# // comments, and output cut off mid-object (open strings and brackets closed).
+from __future__ import annotations
+import json, re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+_DECODER = json.JSONDecoder()
+_SMART = "\u201c\u201d\u201e\u201f\u2033"  # “ ” „ ‟ ″
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_WS = re.compile(r"\s*")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_MAX_CANDIDATES = 4  # "{" positions tried before giving up
+
+
+class UnrecoverableOutput(ValueError):
+    """No usable grading object in the model output; worth a re-ask."""
+
+
+def _closes_single(s: str, i: int) -> bool:
+    # a ' or smart quote ends a string only if JSON structure follows, so
+    # apostrophes and quoted words inside the feedback survive
+    j = _WS.match(s, i).end()
+    return j >= len(s) or s[j] in ",:}]"
+
+
+def _string(s: str, i: int, repairs: Set[str]) -> Tuple[int, str]:
+    q, n = s[i], len(s)
+    if q == '"':
+        closers = '"'
+    elif q in _SMART:
+        closers = _SMART + '"'
+        repairs.add("smart_quotes")
+    else:
+        closers = "'"
+        repairs.add("single_quotes")
+    buf = ['"']
+    i += 1
+    while i < n:
+        c = s[i]
+        if c == "\\":
+            if i + 1 >= n:
+                break
+            nxt = s[i + 1]
+            buf.append("'" if nxt == "'" else s[i:i + 2])
+            i += 2
+            continue
+        if c in closers and (q == '"' or _closes_single(s, i + 1)):
+            buf.append('"')
+            return i + 1, "".join(buf)
+        if c == '"':
+            buf.append('\\"')
+        elif c == "\n":
+            buf.append("\\n")
+            repairs.add("raw_newline")
+        elif c in "\r\t":
+            buf.append("\\r" if c == "\r" else "\\t")
+        else:
+            buf.append(c)
+        i += 1
+    repairs.add("truncated")
+    if len(buf) > 1 and buf[-1].startswith("\\u"):
+        buf.pop()
+    buf.append('"')
+    return n, "".join(buf)
+
+
+def _drop_trailing_comma(out: List[str], repairs: Set[str]) -> None:
+    j = len(out) - 1
+    while j >= 0 and out[j].isspace():
+        j -= 1
+    if j >= 0 and out[j] == ",":
+        del out[j]
+        repairs.add("trailing_comma")
+
+
+def _rewrite(s: str, i: int) -> Tuple[str, Set[str]]:
+    """Canonical JSON text for the object starting at s[i] == "{"."""
+    out: List[str] = []
+    stack: List[str] = []
+    repairs: Set[str] = set()
+    n = len(s)
+    while i < n:
+        c = s[i]
+        if c in "{[":
+            stack.append("}" if c == "{" else "]")
+            out.append(c)
+        elif c in "}]":
+            _drop_trailing_comma(out, repairs)
+            if stack:
+                out.append(stack.pop())
+            if not stack:
+                return "".join(out), repairs
+        elif c == '"' or c == "'" or c in _SMART:
+            i, piece = _string(s, i, repairs)
+            out.append(piece)
+            continue
+        elif c.isalpha() or c == "_":
+            m = _WORD.match(s, i)
+            word = m.group(0)
+            if word in _PY_LITERALS:
+                repairs.add("python_literal")
+            out.append(_PY_LITERALS.get(word, word))
+            i = m.end()
+            continue
+        elif c == "/" and s.startswith("//", i):
+            j = s.find("\n", i)
+            i = n if j < 0 else j
+            repairs.add("comment")
+            continue
+        else:
+            out.append(c)
+        i += 1
+
+    # cut off before the object closed
+    repairs.add("truncated")
+    text = "".join(out).rstrip()
+    text = re.sub(r"(\d)\.$", r"\1", text)                                  # "confidence": 0.
+    text = re.sub(r'[{,]\s*"(?:[^"\\]|\\.)*"\s*:?\s*$', lambda m: m.group(0)[0], text)  # dangling key
+    text = re.sub(r"[,:]\s*$", "", text)
+    text = re.sub(r",(\s*)$", r"\1", text)
+    return text + "".join(reversed(stack)), repairs
+
+
+def extract(s: str) -> Tuple[Dict, Tuple[str, ...]]:
+    """First JSON object in `s` plus the repairs needed (empty if it was valid).
+
+    Raises UnrecoverableOutput if no object can be recovered.
+    """
+    s = (s or "").lstrip("\ufeff")
+    start, tried, last_err = s.find("{"), 0, "no JSON object in output"
+    while start >= 0 and tried < _MAX_CANDIDATES:
+        tried += 1
+        try:
+            obj, _ = _DECODER.raw_decode(s, start)
+            if isinstance(obj, dict):
+                return obj, ()
+        except ValueError:
+            pass
+        text, repairs = _rewrite(s, start)
+        try:
+            obj = json.loads(text)
+            if isinstance(obj, dict):
+                return obj, tuple(sorted(repairs))
+        except ValueError as e:
+            last_err = f"could not repair JSON: {e}"
+        start = s.find("{", start + 1)
+    raise UnrecoverableOutput(last_err)
+
+
+def _label(raw, labels: Optional[Iterable[str]]) -> str:
+    label = re.sub(r"[\s\-]+", "_", str(raw or "").strip().lower())
+    if labels is None:
+        return label
+    by_squashed = {l.replace("_", ""): l for l in labels}
+    return by_squashed.get(label.replace("_", ""), label)
+
+
+def _confidence(raw) -> float:
+    try:
+        if isinstance(raw, str) and raw.strip().endswith("%"):
+            v = float(raw.strip()[:-1]) / 100
+        else:
+            v = float(raw)
+    except (TypeError, ValueError):
+        return 0.0
+    if 1 < v <= 100:
+        v /= 100
+    return min(max(v, 0.0), 1.0)
+
+
+def coerce(obj: Dict, labels: Optional[Iterable[str]] = None) -> Dict:
+    """Normalize label/step_feedback/confidence; UnrecoverableOutput if the label
+    is not one of `labels` (when given)."""
+    out = dict(obj)
+    out["label"] = _label(obj.get("label"), labels)
+    if labels is not None and out["label"] not in set(labels):
+        raise UnrecoverableOutput(f"label {obj.get('label')!r} not in {sorted(labels)}")
+    fb = obj.get("step_feedback", obj.get("feedback", obj.get("stepFeedback", "")))
+    out["step_feedback"] = str(fb if fb is not None else "").strip()
+    out["confidence"] = _confidence(obj.get("confidence", 0))
+    return out
+
+
+def parse(s: str, labels: Optional[Iterable[str]] = None) -> Tuple[Dict, Tuple[str, ...]]:
+    obj, repairs = extract(s)
+    return coerce(obj, labels), repairs
@@ -0,0 +1,262 @@
+# llm_prompts.py
+# Prompt file loading + one-time compilation of the {{var}} templates used by llm.py,
+# and a registry that serves every file in prompts/ and hot-reloads edits.
+from __future__ import annotations
+import hashlib, os, re, string, threading, time
+from types import MappingProxyType
+from typing import Dict, Mapping, NamedTuple, Optional, Tuple
+import yaml
+
+_VAR_RE = re.compile(r"\{\{(\w+)\}\}")
+_USER_FIELDS = {"text", "reasoning", "evidence", "claim_side"}
+_NOT_PROMPTS = {"version", "common_desc", "feedback_style", "components", "user_templates"}
+
+
+class PromptConfigError(ValueError):
+    """The prompt file cannot be compiled (cycle, unknown {{var}}, bad template field)."""
+
+
+class CompiledPrompt(NamedTuple):
+    system: str          # == prefix + suffix
+    user_template: str
+    prefix: str          # shared static block ({{<component>_common}}), identical across claim sides
+    suffix: str          # per-claim remainder
+
+    def system_parts(self) -> Tuple[str, ...]:
+        """System messages, static prefix first so provider prompt caching can hit."""
+        return tuple(p for p in (self.prefix, self.suffix) if p)
+
+
+CompiledTable = Mapping[Tuple[str, Optional[str]], CompiledPrompt]
+
+
+def read_prompts(path: str) -> Tuple[Dict, str]:
+    """Parsed YAML plus the sha256 of the raw file bytes."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    conf = yaml.safe_load(raw.decode("utf-8"))
+    return conf or {}, hashlib.sha256(raw).hexdigest()
+
+
+def prompt_vars(conf: Dict) -> Dict[str, str]:
+    comps = conf.get("components", {}) or {}
+    return {
+        "common_desc": conf.get("common_desc", ""),
+        "feedback_style": conf.get("feedback_style", ""),
+        "evidence_common": comps.get("evidence_common", ""),
+        "reasoning_common": comps.get("reasoning_common", ""),
+    }
+
+
+def _resolve(text: str, raw_vars: Dict[str, str], done: Dict[str, str], stack: Tuple[str, ...], where: str) -> str:
+    def sub(m):
+        name = m.group(1)
+        if name in done:
+            return done[name]
+        if name not in raw_vars:
+            raise PromptConfigError(f"Unresolved {{{{{name}}}}} in {where}")
+        if name in stack:
+            cycle = " -> ".join(stack[stack.index(name):] + (name,))
+            raise PromptConfigError(f"Prompt variable cycle: {cycle}")
+        done[name] = _resolve(raw_vars[name] or "", raw_vars, done, stack + (name,), name)
+        return done[name]
+    return _VAR_RE.sub(sub, text)
+
+
+def _check_user_template(tpl: str, component: str) -> None:
+    try:
+        fields = {f for _, f, _, _ in string.Formatter().parse(tpl) if f is not None}
+    except ValueError as e:
+        raise PromptConfigError(f"Bad user template for {component}: {e}")
+    unknown = fields - _USER_FIELDS
+    if unknown:
+        raise PromptConfigError(f"Unknown field(s) {sorted(unknown)} in user template for {component}")
+
+
+def compile_prompts(conf: Dict) -> CompiledTable:
+    """Resolve every (component, claim_side) system prompt and user template once.
+
+    Keys are (component, claim_side) for per-side prompts and (component, None)
+    for a component's `system` prompt or a top-level string prompt.
+    """
+    raw_vars = prompt_vars(conf)
+    done: Dict[str, str] = {}
+    user_tpls = conf.get("user_templates", {}) or {}
+    table: Dict[Tuple[str, Optional[str]], CompiledPrompt] = {}
+
+    def add(name: str, side: Optional[str], text) -> None:
+        if not isinstance(text, str):
+            return
+        tpl = user_tpls.get(name, "{text}")
+        _check_user_template(tpl, name)
+        where = f"{name}.{side or 'system'}"
+        # A template that opens with {{var}} is split there: the resolved var is the
+        # cacheable prefix, everything after it is the per-claim suffix.
+        m = _VAR_RE.match(text)
+        if m and m.group(1) in raw_vars:
+            prefix = _resolve(m.group(0), raw_vars, done, (), where)
+            suffix = _resolve(text[m.end():], raw_vars, done, (), where)
+        else:
+            prefix, suffix = "", _resolve(text, raw_vars, done, (), where)
+        table[(name, side)] = CompiledPrompt(prefix + suffix, tpl, prefix, suffix)
+
+    for name, comp in (conf.get("components", {}) or {}).items():
+        if not isinstance(comp, dict):
+            continue
+        for side, text in comp.items():
+            add(name, None if side == "system" else side, text)
+    for name, text in conf.items():
+        if name not in _NOT_PROMPTS and (name, None) not in table:
+            add(name, None, text)
+    return MappingProxyType(table)
+
+
+def lookup(table: CompiledTable, name: str, claim_side: Optional[str] = None) -> CompiledPrompt:
+    """name ∈ {'evidence','reasoning'}; falls back to the component's system prompt."""
+    if claim_side:
+        hit = table.get((name, claim_side))
+        if hit is not None:
+            return hit
+    hit = table.get((name, None))
+    if hit is None:
+        raise KeyError(f"Prompt not found for component={name}, claim_side={claim_side}")
+    return hit
+
+
+# ---------------- Registry (hot reload) ----------------
+class PromptSet(NamedTuple):
+    """One prompt file, compiled. Immutable, so a call can hold on to it across reloads."""
+    version: str
+    path: str
+    hash: str
+    conf: Dict
+    compiled: CompiledTable
+
+
+def load_prompt_set(path: str) -> PromptSet:
+    conf, digest = read_prompts(path)
+    version = str(conf.get("version") or os.path.splitext(os.path.basename(path))[0])
+    return PromptSet(version, path, digest, conf, compile_prompts(conf))
+
+
+def _version_key(v: str):
+    return [int(p) if p.isdigit() else p for p in re.split(r"(\d+)", v)]
+
+
+def parse_split(spec) -> Dict[str, float]:
+    """{'v3.0': 90, 'v3.1': 10} from a mapping, JSON-ish dict or 'v3.0:90,v3.1:10'."""
+    if not spec:
+        return {}
+    if isinstance(spec, Mapping):
+        return {str(k): float(v) for k, v in spec.items()}
+    out = {}
+    for part in str(spec).split(","):
+        name, _, weight = part.strip().partition(":")
+        if name:
+            out[name] = float(weight or 1)
+    return out
+
+
+class PromptRegistry:
+    """Every *.yml/*.yaml in a directory, compiled and keyed by version.
+
+    reload() re-reads only files whose mtime/size changed and swaps the whole
+    table in one assignment; a file that fails to compile keeps its previous
+    version live and the error is kept in `errors`. maybe_reload() is the cheap
+    per-call hook (at most one directory scan per `check_interval`).
+    """
+
+    def __init__(self, directory: str, default: Optional[str] = None, split=None,
+                 check_interval: float = 2.0):
+        self.directory = directory
+        self.default_version = default or None
+        self.split = parse_split(split)
+        self.check_interval = check_interval
+        self.errors: Dict[str, str] = {}
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._files: Dict[str, Tuple[Tuple[float, int], PromptSet]] = {}
+        self._sets: Mapping[str, PromptSet] = MappingProxyType({})
+        self._last_check = 0.0
+        self.reload()
+        if not self._sets:
+            raise PromptConfigError(f"No prompt files could be loaded from {directory}: {self.errors}")
+
+    def _scan(self) -> Dict[str, Tuple[float, int]]:
+        out = {}
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith((".yml", ".yaml")):
+                st = entry.stat()
+                out[entry.path] = (st.st_mtime, st.st_size)
+        return out
+
+    def reload(self) -> bool:
+        """Pick up added/changed/removed files; True if the live set changed."""
+        with self._lock:
+            self._last_check = time.monotonic()
+            seen = self._scan()
+            if seen == {p: sig for p, (sig, _) in self._files.items()}:
+                return False
+            files = {}
+            for path, sig in sorted(seen.items()):
+                old = self._files.get(path)
+                if old is not None and old[0] == sig:
+                    files[path] = old
+                    continue
+                try:
+                    files[path] = (sig, load_prompt_set(path))
+                    self.errors.pop(path, None)
+                except Exception as e:  # yaml errors, PromptConfigError, ...
+                    self.errors[path] = f"{type(e).__name__}: {e}"
+                    if old is not None:
+                        files[path] = (sig, old[1])  # keep serving the last good version
+            sets = {}
+            for _, ps in files.values():
+                if ps.version in sets:
+                    self.errors[ps.path] = f"duplicate version {ps.version!r} (also in {sets[ps.version].path})"
+                    continue
+                sets[ps.version] = ps
+            self._files = files
+            self._sets = MappingProxyType(sets)
+            self.reloads += 1
+            return True
+
+    def maybe_reload(self) -> bool:
+        if time.monotonic() - self._last_check >= self.check_interval:
+            return self.reload()
+        return False
+
+    def sets(self) -> Mapping[str, PromptSet]:
+        return self._sets
+
+    def versions(self) -> Tuple[str, ...]:
+        return tuple(sorted(self._sets, key=_version_key))
+
+    def get(self, version: Optional[str] = None) -> PromptSet:
+        """The named version, else the default (PROMPT default or the newest file)."""
+        sets = self._sets
+        if version:
+            ps = sets.get(version)
+            if ps is None:
+                raise KeyError(f"Unknown prompt version {version!r}; have {sorted(sets)}")
+            return ps
+        if self.default_version in sets:
+            return sets[self.default_version]
+        return sets[max(sets, key=_version_key)]
+
+    def assign(self, session_id: str) -> str:
+        """Stable A/B bucket for a session: same id, same version while the split holds."""
+        live = [(v, w) for v, w in sorted(self.split.items()) if v in self._sets and w > 0]
+        if not live:
+            return self.get().version
+        total = sum(w for _, w in live)
+        point = int(hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF * total
+        for v, w in live:
+            point -= w
+            if point < 0:
+                return v
+        return live[-1][0]
+
+    def stats(self) -> Dict:
+        return {"versions": list(self.versions()), "default": self.get().version, "split": dict(self.split),
+                "reloads": self.reloads, "errors": dict(self.errors)}
@@ -0,0 +1,291 @@
+# metrics.py
+# Per-call structured records for llm grading calls, aggregated into in-process
+# counters/histograms and exportable as Prometheus text or JSONL.
+#
+# A record is opened by call() around one step_feedback and lives in a
+# contextvar, so the layers below (prompt build, limiter wait, each HTTP attempt,
+# JSON parse) can add phase timings and fields without threading it through.
+from __future__ import annotations
+import bisect, json, threading, time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 21.0, 34.0, 60.0)
+COUNT_BUCKETS = (1, 2, 3, 4, 5, 8)
+RATIO_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+T = TypeVar("T")
+_current: ContextVar[Optional[Dict]] = ContextVar("llm_call", default=None)
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None if empty)."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class Registry:
+    def __init__(self, recent: int = 500):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._hists: Dict[Tuple[str, Labels], Histogram] = {}
+        self._recent: deque = deque(maxlen=recent)
+        self._hooks: List[Callable[[Dict], None]] = []
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets=LATENCY_BUCKETS, **labels) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            h = self._hists.get(key)
+            if h is None:
+                h = self._hists[key] = Histogram(buckets)
+            h.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def add_hook(self, fn: Callable[[Dict], None]) -> None:
+        """fn(record) is called for every finished call record."""
+        self._hooks.append(fn)
+
+    def emit(self, rec: Dict) -> None:
+        comp, outcome = rec.get("component", ""), rec["outcome"]
+        self.inc("llm_calls_total", component=comp, outcome=outcome, label=rec.get("label") or "")
+        self.observe("llm_call_seconds", rec["seconds"], component=comp, outcome=outcome)
+        for phase, secs in rec["phases"].items():
+            self.observe("llm_phase_seconds", secs, component=comp, phase=phase)
+        if rec["attempts"]:
+            self.observe("llm_attempts", len(rec["attempts"]), COUNT_BUCKETS, component=comp)
+        for a in rec["attempts"]:
+            self.inc("llm_http_responses_total", deployment=a["deployment"], status=a["status"] or "none")
+        for k in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+            if rec.get(k):
+                self.inc("llm_tokens_total", rec[k], component=comp, kind=k[:-7])
+        if rec.get("parse_error"):
+            self.inc("llm_parse_failures_total", component=comp)
+        if isinstance(rec.get("confidence"), (int, float)) and outcome in ("ok", "cached", "coalesced"):
+            self.observe("llm_confidence", rec["confidence"], RATIO_BUCKETS, component=comp, label=rec.get("label") or "")
+        with self._lock:
+            self._recent.append(rec)
+            hooks = list(self._hooks)
+        for fn in hooks:
+            try:
+                fn(rec)
+            except Exception:
+                pass  # a broken sink must never fail a grading call
+
+    def recent(self, n: Optional[int] = None) -> List[Dict]:
+        with self._lock:
+            out = list(self._recent)
+        return out[-n:] if n else out
+
+    # ---- export ----
+    def prometheus_text(self) -> str:
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            hists = sorted(self._hists.items(), key=lambda kv: kv[0])
+            snap = [(k, h.buckets, list(h.counts), h.sum, h.count) for k, h in hists]
+        fmt = lambda labels: "{" + ",".join(f'{k}="{_esc(v)}"' for k, v in labels) + "}" if labels else ""
+        typed = set()
+        for (name, labels), v in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{fmt(labels)} {v:g}")
+        for (name, labels), buckets, counts, total, n in snap:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            acc = 0
+            for le, c in zip(list(buckets) + ["+Inf"], counts):
+                acc += c
+                lines.append(f"{name}_bucket{fmt(labels + (('le', str(le)),))} {acc}")
+            lines.append(f"{name}_sum{fmt(labels)} {total:g}")
+            lines.append(f"{name}_count{fmt(labels)} {n}")
+        return "\n".join(lines) + "\n"
+
+    def jsonl(self) -> str:
+        """One JSON object per series."""
+        out = []
+        with self._lock:
+            for (name, labels), v in sorted(self._counters.items()):
+                out.append({"name": name, "type": "counter", "labels": dict(labels), "value": v})
+            for (name, labels), h in sorted(self._hists.items(), key=lambda kv: kv[0]):
+                out.append({"name": name, "type": "histogram", "labels": dict(labels),
+                            "buckets": list(h.buckets), "counts": list(h.counts), "sum": h.sum, "count": h.count})
+        return "".join(json.dumps(o) + "\n" for o in out)
+
+    def summary(self) -> Dict[str, Dict]:
+        """Compact {series: {count, mean, p50, p95}} view of every histogram."""
+        out = {}
+        with self._lock:
+            for (name, labels), h in sorted(self._hists.items(), key=lambda kv: kv[0]):
+                key = name + "".join(f"[{k}={v}]" for k, v in labels)
+                out[key] = {"count": h.count, "mean": h.sum / h.count if h.count else None,
+                            "p50": h.quantile(0.5), "p95": h.quantile(0.95)}
+        return out
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._hists.clear()
+            self._recent.clear()
+
+
+def _esc(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = Registry()
+
+
+# ---- per-call records ----
+class call:
+    """`with metrics.call("evidence", "agree") as rec:` opens the record for one grading call."""
+
+    def __init__(self, component: str, claim_side: Optional[str] = None, registry: Registry = REGISTRY, **fields):
+        self.registry = registry
+        self.rec = {"ts": time.time(), "component": component, "claim_side": claim_side or "",
+                    "phases": {}, "attempts": [], **fields}
+
+    def __enter__(self) -> Dict:
+        self.t0 = time.perf_counter()
+        self.token = _current.set(self.rec)
+        return self.rec
+
+    def __exit__(self, et, e, tb) -> None:
+        try:
+            _current.reset(self.token)
+        except ValueError:
+            pass  # generator closed from another context (e.g. garbage-collected stream)
+        rec = self.rec
+        rec["seconds"] = time.perf_counter() - self.t0
+        rec["retries"] = max(0, len(rec["attempts"]) - 1)
+        if isinstance(e, GeneratorExit):
+            rec["outcome"] = "abandoned"  # stream closed by the consumer before the end
+        elif e is not None:
+            rec["outcome"] = "parse_error" if rec.get("parse_error") else "error"
+            rec["error"] = f"{type(e).__name__}: {e}"[:300]
+        else:
+            rec.setdefault("outcome", "ok")
+        self.registry.emit(rec)
+
+
+def current() -> Optional[Dict]:
+    return _current.get()
+
+
+def note(**fields) -> None:
+    rec = _current.get()
+    if rec is not None:
+        rec.update(fields)
+
+
+def add_phase(name: str, seconds: float) -> None:
+    rec = _current.get()
+    if rec is not None:
+        rec["phases"][name] = rec["phases"].get(name, 0.0) + seconds
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(name, time.perf_counter() - t0)
+
+
+def attempt(deployment: str, status: Optional[int], seconds: float, error: Optional[str] = None) -> None:
+    rec = _current.get()
+    if rec is not None:
+        rec["attempts"].append({"deployment": deployment, "status": status,
+                                "seconds": round(seconds, 4), "error": error})
+        rec["phases"]["network"] = rec["phases"].get("network", 0.0) + seconds
+
+
+async def carry(coro: Awaitable[T], rec: Optional[Dict]) -> T:
+    """Run `coro` with `rec` as the current record (for hops onto another loop)."""
+    _current.set(rec)
+    return await coro
+
+
+# ---- sinks ----
+class JsonlSink:
+    """Hook that appends every call record to a JSONL file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, rec: Dict) -> None:
+        line = json.dumps(rec, ensure_ascii=False, default=str) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def serve(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """Expose GET /metrics (Prometheus text) and /metrics.jsonl on a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, ctype = registry.prometheus_text(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.jsonl":
+                body, ctype = registry.jsonl(), "application/x-ndjson"
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+            raw = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True).start()
+    return httpd
@@ -0,0 +1,245 @@
+# mock_azure.py
+# Local stand-in for the Azure OpenAI chat-completions endpoint (JSON + SSE), with
+# configurable latency, 5xx/429 injection, a context window and canned grading outputs.
+#
+# Run: python -m mock_azure --port 8089 --latency lognormal:0.8,0.35 --throttle-rate 0.05
+# then point AZURE_ENDPOINT at http://127.0.0.1:8089 (any key/deployment/api-version).
+from __future__ import annotations
+import argparse, hashlib, json, math, random, re, sys, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+_PATH = re.compile(r"^/openai/deployments/([^/]+)/chat/completions")
+_SUBMISSION = re.compile(r"<submission index=(\d+)>")
+
+CANNED = {
+    "evidence": {
+        "supportive": "You used numbers from the table to back up your claim. Can you say which trend matters most?",
+        "non_supportive": "Look again at the table. Which numbers change from Year 3 to Year 5, and do they match your claim?",
+    },
+    "reasoning": {
+        "valid": "You linked the spiders, the rootworms and the corn harvest. Nice work explaining the mechanism!",
+        "alternative": "How does the predator-prey relationship connect your data to your claim?",
+    },
+}
+_PASS = {"evidence": "supportive", "reasoning": "valid"}
+_FAIL = {"evidence": "non_supportive", "reasoning": "alternative"}
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """'const:S' | 'uniform:A,B' | 'normal:MEAN,SD' | 'lognormal:MEDIAN,SIGMA' (seconds)."""
+    kind, _, args = spec.partition(":")
+    vals = [float(x) for x in args.split(",") if x]
+    if kind == "const":
+        return lambda: vals[0]
+    if kind == "uniform":
+        return lambda: random.uniform(vals[0], vals[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(vals[0], vals[1]))
+    if kind == "lognormal":
+        mu = math.log(vals[0])
+        return lambda: random.lognormvariate(mu, vals[1])
+    raise ValueError(f"unknown latency spec: {spec}")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients dropping keep-alive connections on exit are not errors here
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class MockAzure:
+    """Threaded HTTP server; use start()/stop() in-process or run the module."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: str = "const:0.05",
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, retry_after_ms: int = 500,
+                 pass_rate: float = 0.6, canned: Optional[Dict] = None, chunk_chars: int = 8,
+                 seed: Optional[int] = None, max_prompt_tokens: int = 0):
+        if seed is not None:
+            random.seed(seed)
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after_ms = retry_after_ms
+        self.pass_rate = pass_rate
+        self.canned = canned or CANNED
+        self.chunk_chars = chunk_chars
+        self.max_prompt_tokens = max_prompt_tokens  # 0 = unlimited; larger prompts get 400 context_length_exceeded
+        self.counts = {"requests": 0, "ok": 0, "throttled": 0, "errors": 0, "rejected": 0, "streamed": 0}
+        self._prefixes = set()
+        self._lock = threading.Lock()
+        self.httpd = _Server((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockAzure":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-azure", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] += 1
+
+    def _grade(self, component: str) -> Dict:
+        label = _PASS[component] if random.random() < self.pass_rate else _FAIL[component]
+        return {"label": label, "step_feedback": self.canned[component][label],
+                "confidence": round(random.uniform(0.6, 0.95), 2)}
+
+    def completion(self, body: Dict) -> Dict:
+        """Canned JSON answer + a usage block that mimics prefix caching."""
+        msgs = body.get("messages") or []
+        system = "".join(m.get("content", "") for m in msgs if m.get("role") == "system")
+        component = "reasoning" if "**REASONING**" in system else "evidence"
+        user = msgs[-1].get("content", "") if msgs else ""
+        indices = [int(i) for i in _SUBMISSION.findall(user)]
+        if indices:  # packed request from llm.step_feedback_batch
+            content = json.dumps({"results": [dict(self._grade(component), index=i) for i in indices]})
+        else:
+            content = json.dumps(self._grade(component))
+        prompt_tokens = sum(len(m.get("content", "")) for m in msgs) // 4
+        first = msgs[0].get("content", "") if msgs else ""
+        prefix = hashlib.sha256(first.encode("utf-8")).hexdigest()
+        with self._lock:
+            seen = prefix in self._prefixes
+            self._prefixes.add(prefix)
+        cached = (len(first) // 4) // 128 * 128 if seen and len(first) // 4 >= 1024 else 0
+        completion_tokens = len(content) // 4
+        return {
+            "content": content,
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens,
+                      "prompt_tokens_details": {"cached_tokens": cached}},
+        }
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, payload: Dict, headers: Optional[Dict] = None) -> None:
+                raw = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def do_GET(self):
+                if self.path == "/stats":
+                    with mock._lock:
+                        self._send(200, dict(mock.counts))
+                else:
+                    self._send(404, {"error": {"code": "NotFound"}})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                if not _PATH.match(self.path):
+                    return self._send(404, {"error": {"code": "DeploymentNotFound"}})
+                mock._count("requests")
+                prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages") or []) // 4
+                if mock.max_prompt_tokens and prompt_tokens > mock.max_prompt_tokens:
+                    mock._count("rejected")
+                    return self._send(400, {"error": {
+                        "code": "context_length_exceeded",
+                        "message": f"This model's maximum context length is {mock.max_prompt_tokens} tokens, "
+                                   f"however you requested {prompt_tokens} tokens."}})
+                r = random.random()
+                if r < mock.throttle_rate:
+                    mock._count("throttled")
+                    return self._send(429, {"error": {"code": "429", "message": "Rate limit is exceeded."}},
+                                      {"retry-after-ms": str(mock.retry_after_ms),
+                                       "retry-after": str(max(1, math.ceil(mock.retry_after_ms / 1000)))})
+                if r < mock.throttle_rate + mock.error_rate:
+                    mock._count("errors")
+                    time.sleep(mock.latency() / 4)
+                    return self._send(500, {"error": {"code": "InternalServerError"}})
+                out = mock.completion(body)
+                delay = mock.latency()
+                if body.get("stream"):
+                    return self._stream(out, delay, body)
+                time.sleep(delay)
+                mock._count("ok")
+                self._send(200, {
+                    "id": "chatcmpl-mock", "object": "chat.completion", "model": "mock",
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": out["content"]}}],
+                    "usage": out["usage"],
+                })
+
+            def _stream(self, out: Dict, delay: float, body: Dict) -> None:
+                # first chunk after ~1/3 of the latency, the rest spread over the remainder
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def event(obj) -> None:
+                    raw = ("data: " + (obj if isinstance(obj, str) else json.dumps(obj)) + "\n\n").encode("utf-8")
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(raw), raw))
+                    self.wfile.flush()
+
+                content = out["content"]
+                pieces = [content[i:i + mock.chunk_chars] for i in range(0, len(content), mock.chunk_chars)]
+                time.sleep(delay / 3)
+                event({"choices": [], "prompt_filter_results": []})
+                step = (delay * 2 / 3) / max(1, len(pieces))
+                for p in pieces:
+                    event({"choices": [{"index": 0, "delta": {"content": p}}]})
+                    time.sleep(step)
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    event({"choices": [], "usage": out["usage"]})
+                event("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+                mock._count("streamed")
+                mock._count("ok")
+
+        return Handler
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m mock_azure", description="Mock Azure OpenAI chat-completions server.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency", default="lognormal:0.8,0.35", help="const:S | uniform:A,B | normal:M,SD | lognormal:MEDIAN,SIGMA")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    ap.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    ap.add_argument("--retry-after-ms", type=int, default=500)
+    ap.add_argument("--pass-rate", type=float, default=0.6, help="fraction of supportive/valid labels")
+    ap.add_argument("--canned", help="JSON file shaped like mock_azure.CANNED")
+    ap.add_argument("--seed", type=int)
+    ap.add_argument("--max-prompt-tokens", type=int, default=0, help="answer longer prompts with 400 context_length_exceeded")
+    args = ap.parse_args(argv)
+    canned = None
+    if args.canned:
+        with open(args.canned, "r", encoding="utf-8") as f:
+            canned = json.load(f)
+    mock = MockAzure(args.host, args.port, args.latency, args.error_rate, args.throttle_rate,
+                     args.retry_after_ms, args.pass_rate, canned, seed=args.seed,
+                     max_prompt_tokens=args.max_prompt_tokens)
+    print(f"mock Azure OpenAI listening on {mock.url}", flush=True)
+    try:
+        mock.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
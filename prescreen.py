@@ -0,0 +1,115 @@
+# prescreen.py
+# Cheap local checks that settle obviously failing submissions without an LLM call:
+# empty/too short, or off-topic (no number from the yearly table and no word about
+# corn, spiders, rootworms, eggs, ...). Anything it is not sure about returns None
+# and goes to the model as before.
+from __future__ import annotations
+import random, re, threading
+from typing import Dict, Iterable, Optional
+
+FAIL_LABEL = {"evidence": "non_supportive", "reasoning": "alternative"}
+
+# topical word stems; a token matches if it starts with one of these
+KEYWORDS = (
+    "corn", "harvest", "spider", "rootworm", "worm", "egg", "year", "plant", "crop", "farm",
+    "predat", "prey", "eat", "bug", "insect", "pest", "popul", "infest", "data", "table", "graph", "chart", "trend",
+    "increas", "decreas", "drop", "rise", "rose", "grow", "grew", "fell", "fall", "declin",
+)
+
+_NUMBER_WORDS = {w: i for i, w in enumerate(
+    "zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen "
+    "fifteen sixteen seventeen eighteen nineteen twenty".split())}
+_NUMBER_WORDS.update({"thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70,
+                      "eighty": 80, "ninety": 90, "hundred": 100})
+
+_TOKEN = re.compile(r"[a-z]+|\d+")
+
+TEMPLATES = {
+    ("evidence", "empty"): "It looks like your evidence is empty. Which numbers in the table or graph back up your claim?",
+    ("evidence", "too_short"): "Can you say more? Pick numbers from the table or graph that show why you chose your claim.",
+    ("evidence", "off_topic"): "Let's get back to the corn farm data. Which numbers about corn, spiders or rootworm eggs support your claim?",
+    ("evidence", "no_data"): "Your evidence needs data. Which numbers from the table show the trend you are describing?",
+    ("reasoning", "empty"): "It looks like your reasoning is empty. How does your evidence connect to your claim?",
+    ("reasoning", "too_short"): "Can you say more? Explain how the spiders, the rootworms and the corn are connected.",
+    ("reasoning", "off_topic"): "Let's get back to the task. How do the spiders and rootworms explain what your evidence shows?",
+}
+
+
+def table_numbers(*sources) -> set:
+    """Every integer in the given strings / {column: [values]} tables."""
+    out = set()
+    for src in sources:
+        if isinstance(src, str):
+            out.update(int(n) for n in re.findall(r"\d+", src))
+        elif isinstance(src, dict):
+            for vals in src.values():
+                out.update(int(v) for v in vals)
+    return out
+
+
+class Prescreener:
+    """screen() returns a step_feedback-shaped dict, or None when the LLM should decide."""
+
+    def __init__(self, numbers: Iterable[int], keywords: Iterable[str] = KEYWORDS, min_chars: int = 12,
+                 min_words: int = 3, require_numbers: bool = False, shadow_rate: float = 0.0):
+        self.numbers = frozenset(numbers)
+        self.keywords = tuple(keywords)
+        self.min_chars = min_chars
+        self.min_words = min_words
+        self.require_numbers = require_numbers
+        self.shadow_rate = shadow_rate
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.hits = 0
+        self.by_reason: Dict[str, int] = {}
+        self.shadow = {"calls": 0, "agree": 0, "disagree": 0, "errors": 0}
+
+    def reason(self, component: str, text: str) -> Optional[str]:
+        s = (text or "").strip()
+        if not s:
+            return "empty"
+        tokens = _TOKEN.findall(s.lower())
+        if len(s) < self.min_chars or len(tokens) < self.min_words:
+            return "too_short"
+        nums = {int(t) for t in tokens if t.isdigit()} | {_NUMBER_WORDS[t] for t in tokens if t in _NUMBER_WORDS}
+        has_data = bool(nums & self.numbers)
+        on_topic = any(t.startswith(self.keywords) for t in tokens if not t.isdigit())
+        if not has_data and not on_topic:
+            return "off_topic"
+        if component == "evidence" and self.require_numbers and not has_data:
+            return "no_data"
+        return None
+
+    def screen(self, component: str, text: str) -> Optional[Dict]:
+        why = self.reason(component, text) if component in FAIL_LABEL else None
+        with self._lock:
+            self.checked += 1
+            if why is not None:
+                self.hits += 1
+                self.by_reason[why] = self.by_reason.get(why, 0) + 1
+        if why is None:
+            return None
+        return {"label": FAIL_LABEL[component], "step_feedback": TEMPLATES[(component, why)],
+                "confidence": 1.0, "prescreened": True, "prescreen_reason": why}
+
+    def want_shadow(self) -> bool:
+        """Sample prescreened results to double-check against the model."""
+        return self.shadow_rate > 0 and random.random() < self.shadow_rate
+
+    def record_shadow(self, screened: Dict, llm_label: Optional[str]) -> None:
+        with self._lock:
+            self.shadow["calls"] += 1
+            if llm_label is None:
+                self.shadow["errors"] += 1
+            elif llm_label == screened["label"]:
+                self.shadow["agree"] += 1
+            else:
+                self.shadow["disagree"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            judged = self.shadow["agree"] + self.shadow["disagree"]
+            return {"checked": self.checked, "hits": self.hits,
+                    "hit_rate": self.hits / self.checked if self.checked else 0.0,
+                    "by_reason": dict(self.by_reason), "shadow": dict(self.shadow),
+                    "agreement": self.shadow["agree"] / judged if judged else None}
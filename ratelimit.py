@@ -0,0 +1,241 @@
+# ratelimit.py
+# Client-side throttling for Azure OpenAI: adaptive token buckets + circuit breaker.
+from __future__ import annotations
+import email.utils, random, threading, time
+from typing import Dict, Mapping, Optional
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream that is currently failing."""
+
+    def __init__(self, retry_in: float):
+        self.retry_in = max(0.0, retry_in)
+        super().__init__(f"Upstream unavailable; circuit open for another {self.retry_in:.0f}s")
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait from `retry-after-ms` / `retry-after` (delta or HTTP date)."""
+    if not headers:
+        return None
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return max(0.0, float(ms) / 1000.0)
+        except ValueError:
+            pass
+    ra = headers.get("retry-after")
+    if not ra:
+        return None
+    try:
+        return max(0.0, float(ra))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(ra)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int, base: float = 1.5, cap: float = 20.0, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(cap, base ** (attempt + 1)))
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, 0.25 * max(retry_after, 1.0)))
+    return delay
+
+
+class _Bucket:
+    def __init__(self, per_minute: float, stamp: float):
+        self.per_minute = float(per_minute)
+        self.level = float(per_minute)
+        self.stamp = stamp
+
+    def refill(self, now: float, scale: float) -> None:
+        rate = self.per_minute * scale / 60.0
+        self.level = min(self.per_minute * scale, self.level + (now - self.stamp) * rate)
+        self.stamp = now
+
+    def take(self, amount: float, scale: float) -> float:
+        """Reserve `amount` (level may go negative); return seconds until it is covered."""
+        self.level -= amount
+        if self.level >= 0:
+            return 0.0
+        return -self.level / (self.per_minute * scale / 60.0)
+
+
+class AdaptiveRateLimiter:
+    """Requests/min + tokens/min token buckets shared by all callers in a process.
+
+    On 429 the effective rate is halved (down to `min_scale`, at most once per
+    `decrease_interval` so a burst of concurrent 429s counts as one signal) and
+    every caller is held until the server's Retry-After has passed; each success
+    creeps the rate back up by `recover`. A limit of 0 disables that bucket.
+    """
+    _clock = staticmethod(time.monotonic)
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, min_scale: float = 0.1, recover: float = 0.05,
+                 decrease_interval: float = 2.0):
+        self._lock = threading.Lock()
+        self._req = _Bucket(rpm, self._clock()) if rpm > 0 else None
+        self._tok = _Bucket(tpm, self._clock()) if tpm > 0 else None
+        self.min_scale = min_scale
+        self.recover = recover
+        self.decrease_interval = decrease_interval
+        self.scale = 1.0
+        self._last_decrease = float("-inf")
+        self.blocked_until = 0.0
+        self.throttled = 0
+        self.waited_s = 0.0
+
+    def reserve(self, tokens: int) -> float:
+        """Claim capacity for one request; returns how long the caller must sleep first."""
+        with self._lock:
+            now = self._clock()
+            wait = max(0.0, self.blocked_until - now)
+            for bucket, amount in ((self._req, 1), (self._tok, tokens)):
+                if bucket is not None:
+                    bucket.refill(now, self.scale)
+                    wait = max(wait, bucket.take(amount, self.scale))
+            self.waited_s += wait
+            return wait
+
+    def settle(self, estimated: int, actual: int) -> None:
+        """Correct a token reservation once the real usage is known."""
+        if self._tok is None or not actual:
+            return
+        with self._lock:
+            self._tok.level += estimated - actual
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            self.throttled += 1
+            now = self._clock()
+            if now - self._last_decrease >= self.decrease_interval:
+                self.scale = max(self.min_scale, self.scale * 0.5)
+                self._last_decrease = now
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.scale = min(1.0, self.scale + self.recover)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "scale": self.scale,
+                "throttled": self.throttled,
+                "waited_s": self.waited_s,
+                "blocked_for_s": max(0.0, self.blocked_until - self._clock()),
+            }
+
+
+class SharedRateLimiter(AdaptiveRateLimiter):
+    """AdaptiveRateLimiter whose buckets, scale and Retry-After hold live in a
+    shared_store document, so every replica draws on one RPM/TPM budget.
+
+    Each operation loads the document, runs the normal logic and writes it back
+    in one atomic store.update(). Wall-clock time, since processes don't share
+    a monotonic clock. Counters in stats() (throttled, waited_s) stay per process.
+    """
+    _clock = staticmethod(time.time)
+
+    def __init__(self, store, key: str, rpm: float = 0, tpm: float = 0, **kw):
+        super().__init__(rpm=rpm, tpm=tpm, **kw)
+        self._lock = threading.RLock()  # held around the base methods, which take it again
+        self._last_decrease = 0.0
+        self.store = store
+        self.key = key
+
+    def _load(self, doc: Optional[Dict]) -> None:
+        if doc is None:
+            return  # first use anywhere: start from this instance's full buckets
+        for name, b in (("req", self._req), ("tok", self._tok)):
+            if b is not None and name in doc:
+                b.level, b.stamp = doc[name]
+        self.scale, self._last_decrease, self.blocked_until = doc["scale"], doc["last_decrease"], doc["blocked_until"]
+
+    def _dump(self) -> Dict:
+        doc = {"scale": self.scale, "last_decrease": self._last_decrease, "blocked_until": self.blocked_until}
+        for name, b in (("req", self._req), ("tok", self._tok)):
+            if b is not None:
+                doc[name] = [b.level, b.stamp]
+        return doc
+
+    def _shared(self, method, *args):
+        def apply(doc):
+            self._load(doc)
+            result = method(self, *args)
+            return self._dump(), result
+        with self._lock:
+            return self.store.update(self.key, apply)
+
+    def reserve(self, tokens: int) -> float:
+        return self._shared(AdaptiveRateLimiter.reserve, tokens)
+
+    def settle(self, estimated: int, actual: int) -> None:
+        if self._tok is not None and actual:
+            self._shared(AdaptiveRateLimiter.settle, estimated, actual)
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        self._shared(AdaptiveRateLimiter.on_throttle, retry_after)
+
+    def on_success(self) -> None:
+        if self.scale < 1.0:  # nothing to recover (as far as this replica last saw)
+            self._shared(AdaptiveRateLimiter.on_success)
+
+
+class CircuitBreaker:
+    """closed → open after `failure_threshold` consecutive failures → half-open
+    after `reset_timeout` (one trial call) → closed on success / open on failure."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self._lock = threading.Lock()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self.state = "closed"
+        self._trial = False
+        self.rejected = 0
+
+    def check(self) -> None:
+        """Raise CircuitOpenError unless a call may go upstream now."""
+        with self._lock:
+            if self.state == "closed":
+                return
+            now = time.monotonic()
+            if self.state == "open" and now - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial = False
+            if self.state == "half_open" and not self._trial:
+                self._trial = True
+                return
+            self.rejected += 1
+            raise CircuitOpenError(self.opened_at + self.reset_timeout - now)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.state = "closed"
+            self._trial = False
+
+    def release_trial(self) -> None:
+        """The admitted half-open trial ended with no outcome (cancelled or abandoned):
+        let the next call try instead of rejecting everything until restart."""
+        with self._lock:
+            if self.state == "half_open":
+                self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
@@ -0,0 +1,164 @@
+# shared_store.py
+# Cross-process state for several app replicas: the LLM response cache, the
+# rate-limit buckets and session history, kept in one store instead of per process.
+#
+# SHARED_STORE_URL picks the backend (llm reads it; empty = per-process as before):
+#   sqlite:///path/shared.sqlite   replicas on one host or a shared volume (WAL mode)
+#   redis://host:6379/0            any Redis-compatible server (`pip install redis`)
+# Both expose the same small API: get/set/add with TTL, an atomic read-modify-write
+# of a JSON document, and append-only lists.
+from __future__ import annotations
+import json, os, sqlite3, threading, time
+from typing import Any, Callable, List, Optional, Tuple
+
+# fn(current JSON document or None) -> (new document, value returned by update)
+Updater = Callable[[Optional[Any]], Tuple[Any, Any]]
+
+
+class SqliteStore:
+    """One SQLite file in WAL mode; writers across processes serialize on its lock
+    (busy timeout), read-modify-writes use BEGIN IMMEDIATE."""
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            self._db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS lists ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, value TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS lists_key ON lists(key, id)")
+            self._db.execute("DELETE FROM kv WHERE expires <= ?", (time.time(),))
+
+    @staticmethod
+    def _expires(ttl: Optional[float]) -> Optional[float]:
+        return time.time() + ttl if ttl else None
+
+    def _wrote(self) -> None:
+        self._writes += 1
+        if self._writes % 500 == 0:
+            self._db.execute("DELETE FROM kv WHERE expires <= ?", (time.time(),))
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                                   (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO kv(key, value, expires) VALUES (?, ?, ?)",
+                             (key, value, self._expires(ttl)))
+            self._wrote()
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        """Set only if absent (or expired); False if another writer got there first."""
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO kv(key, value, expires) VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE"
+                " SET value = excluded.value, expires = excluded.expires WHERE kv.expires <= ?",
+                (key, value, self._expires(ttl), time.time()))
+            self._wrote()
+            return cur.rowcount > 0
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def update(self, key: str, fn: Updater) -> Any:
+        """Atomically replace the JSON document at `key` with fn(doc)[0]; returns fn(doc)[1]."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+                doc, result = fn(json.loads(row[0]) if row else None)
+                self._db.execute("INSERT OR REPLACE INTO kv(key, value, expires) VALUES (?, ?, NULL)",
+                                 (key, json.dumps(doc)))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return result
+
+    def rpush(self, key: str, value: str) -> None:
+        with self._lock:
+            self._db.execute("INSERT INTO lists(key, value) VALUES (?, ?)", (key, value))
+
+    def lrange(self, key: str) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._db.execute("SELECT value FROM lists WHERE key = ? ORDER BY id", (key,))]
+
+    def clear(self, prefix: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM kv WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+
+class RedisStore:
+    """Same API on Redis: TTLs are native, update() is an optimistic WATCH/MULTI loop."""
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("SHARED_STORE_URL=redis://... needs the redis package (pip install redis)") from e
+        self._redis = redis
+        self._r = redis.Redis.from_url(url, decode_responses=True)
+
+    @staticmethod
+    def _px(ttl: Optional[float]) -> Optional[int]:
+        return int(ttl * 1000) if ttl else None
+
+    def get(self, key: str) -> Optional[str]:
+        return self._r.get(key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self._r.set(key, value, px=self._px(ttl))
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        return bool(self._r.set(key, value, px=self._px(ttl), nx=True))
+
+    def delete(self, key: str) -> None:
+        self._r.delete(key)
+
+    def update(self, key: str, fn: Updater) -> Any:
+        with self._r.pipeline() as p:
+            while True:
+                try:
+                    p.watch(key)
+                    raw = p.get(key)
+                    doc, result = fn(json.loads(raw) if raw else None)
+                    p.multi()
+                    p.set(key, json.dumps(doc))
+                    p.execute()
+                    return result
+                except self._redis.WatchError:
+                    continue  # another replica changed it in between; redo with its value
+
+    def rpush(self, key: str, value: str) -> None:
+        self._r.rpush(key, value)
+
+    def lrange(self, key: str) -> List[str]:
+        return self._r.lrange(key, 0, -1)
+
+    def clear(self, prefix: str) -> None:
+        for key in self._r.scan_iter(match=prefix + "*"):
+            self._r.delete(key)
+
+
+def open_store(url: str):
+    """Store for a SHARED_STORE_URL, or None when it is empty."""
+    if not url:
+        return None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStore(url)
+    if url.startswith("sqlite:///"):
+        return SqliteStore(url[len("sqlite:///"):])
+    raise ValueError(f"SHARED_STORE_URL must start with sqlite:/// or redis://, got {url!r}")